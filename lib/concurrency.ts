@@ -5,7 +5,9 @@
  * Production: For multi-instance deployments, use a distributed queue (e.g. Bull + Redis).
  */
 
-const MAX_CONCURRENT_CONVERSIONS = 3;
+// Only bounds requests waiting on the Python backend, which splits each conversion into a download
+// stage (DOWNLOAD_SLOTS) and an FFmpeg stage (POSTPROCESS_SLOTS) and enforces the real limits itself.
+const MAX_CONCURRENT_CONVERSIONS = Number(process.env.MAX_CONCURRENT_CONVERSIONS) || 12;
 
 let activeCount = 0;
 const waitQueue: Array<() => void> = [];
@@ -1,30 +1,353 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from yt import YouTubeDownloader  # Import from yt.py
+from yt import YouTubeDownloader, DOWNLOADS_DIR  # Import from yt.py
+from singleflight import SingleFlight
+from urls import canonical_url, playlist_id
+from jobs import JobStore, JobWorkers
+from workers import ProcessWorkerPool
+from stages import StageGate, DOWNLOAD_SLOTS, POSTPROCESS_SLOTS
+from progress import ProgressBroker
+from metrics import CONTENT_TYPE, PhaseTimer, Registry
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+import functools
 import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
 
 app = FastAPI()
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-downloader = YouTubeDownloader()
-executor = ThreadPoolExecutor(max_workers=5)  # Max 5 concurrent
+# Prometheus metrics, served by GET /metrics
+registry = Registry()
+rate_limited = registry.counter("ytdl_rate_limited_total", "Requests rejected by the rate limiter", ["path"])
+
+def rate_limit_exceeded(request, exc):
+    rate_limited.inc(path=request.url.path)
+    return _rate_limit_exceeded_handler(request, exc)
+
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded)
+
+# Built on first use rather than at import (spawned worker processes re-import this module)
+downloader = None
+downloader_lock = threading.Lock()
+
+def get_downloader():
+    global downloader
+    if downloader is None:
+        with downloader_lock:
+            if downloader is None:
+                downloader = YouTubeDownloader()
+    return downloader
+
+class Slots:
+    """asyncio.Semaphore that also counts its holders and waiters, for /metrics"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+# Whole conversions in flight. Kept wide on purpose: the real limits are the per-stage slots
+# (DOWNLOAD_SLOTS network, POSTPROCESS_SLOTS FFmpeg) that every conversion passes through
+CONVERSION_WORKERS = int(os.environ.get("CONVERSION_WORKERS", DOWNLOAD_SLOTS + POSTPROCESS_SLOTS))
+executor = ThreadPoolExecutor(max_workers=CONVERSION_WORKERS)
+conversion_slots = Slots(CONVERSION_WORKERS)
+CONVERSION_QUEUE_TIMEOUT = float(os.environ.get("CONVERSION_QUEUE_TIMEOUT", 120))
+
+# /info gets its own pool so slow extractions never wait behind (or block) conversions
+INFO_WORKERS = int(os.environ.get("INFO_WORKERS", 8))
+INFO_QUEUE_TIMEOUT = float(os.environ.get("INFO_QUEUE_TIMEOUT", 10))
+info_executor = ThreadPoolExecutor(max_workers=INFO_WORKERS, thread_name_prefix="info")
+info_slots = Slots(INFO_WORKERS)
+
+# GET /poster (i.ytimg fetch + Pillow resize / AVIF encode) is high-volume; its own pool keeps it from
+# filling the /info slots
+POSTER_WORKERS = int(os.environ.get("POSTER_WORKERS", 4))
+POSTER_QUEUE_TIMEOUT = float(os.environ.get("POSTER_QUEUE_TIMEOUT", 10))
+poster_executor = ThreadPoolExecutor(max_workers=POSTER_WORKERS, thread_name_prefix="poster")
+poster_slots = Slots(POSTER_WORKERS)
+
+# Identical concurrent conversions (same video, format, quality) share one run
+conversions = SingleFlight()
+
+# Calls handed to each executor that haven't started running yet, for /metrics
+executor_queued = {executor: 0, info_executor: 0, poster_executor: 0}
+executor_queued_lock = threading.Lock()
+
+async def run_bounded(pool, slots, queue_timeout, fn, *args):
+    """Runs blocking fn in pool off the event loop; 503 if no slot frees up within queue_timeout"""
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=queue_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, try again later")
+    started = [False]
+
+    def run():
+        with executor_queued_lock:
+            started[0] = True
+            executor_queued[pool] -= 1
+        return fn(*args)
+
+    with executor_queued_lock:
+        executor_queued[pool] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, run)
+    finally:
+        with executor_queued_lock:
+            if not started[0]:
+                started[0] = True  # cancelled before a thread picked it up
+                executor_queued[pool] -= 1
+        slots.release()
+
+def require_video_url(url):
+    """Canonical watch URL; rejects anything that isn't a YouTube video URL before any yt-dlp work"""
+    canonical = canonical_url(url)
+    if not canonical:
+        raise HTTPException(status_code=400, detail="Invalid YouTube video URL")
+    return canonical
+
+prefetches = set()  # running background upgrades, referenced so they aren't garbage-collected
+
+async def prefetch_full_info(url):
+    """Upgrades a preview in the background: warms info_cache so the follow-up /download or mode=full hits it"""
+    try:
+        await run_bounded(info_executor, info_slots, INFO_QUEUE_TIMEOUT, get_downloader().get_cached_video_info, url)
+    except HTTPException:
+        pass  # busy — the download extracts on its own
 
 @app.post("/info")
 @limiter.limit("5/minute")
 async def get_info(request: Request):
+    """Video card. mode "full" (default) runs a full extraction; "preview" answers from oEmbed or a light
+    extraction (complete: false), and with prefetch: true starts the full extraction in the background."""
     data = await request.json()
     url = data.get("url")
+    mode = data.get("mode", "full")
     if not url:
         raise HTTPException(status_code=400, detail="URL required")
-    result = json.loads(downloader.get_video_info_json(url))
+    if mode not in ("full", "preview"):
+        raise HTTPException(status_code=400, detail="mode must be full or preview")
+    url = require_video_url(url)
+    result = json.loads(await run_bounded(info_executor, info_slots, INFO_QUEUE_TIMEOUT, get_downloader().get_video_info_json, url, mode))
+    if mode == "preview" and data.get("prefetch") and result.get("success") and not result.get("complete"):
+        task = asyncio.create_task(prefetch_full_info(url))
+        prefetches.add(task)
+        task.add_done_callback(prefetches.discard)
     return result
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "info": get_downloader().info_cache.stats(),
+        "previews": get_downloader().preview_cache.stats(),
+        "results": get_downloader().result_cache.stats(),
+        "posters": get_downloader().poster_cache.stats(),
+        "ydl": get_downloader().ydl_pool.stats(),
+        "conversions": conversions.stats(),
+        "workers": worker_pool.stats() if worker_pool is not None else None,
+        "stages": stage_gate().stats(),
+    }
+
+def slot_usage(field):
+    """{(pool,): active or waiting} for the slots in front of each executor"""
+    pools = {"conversion": conversion_slots, "info": info_slots, "poster": poster_slots, "stream": stream_slots}
+    return {(name,): getattr(slots, field) for name, slots in pools.items()}
+
+def cache_counters():
+    """{cache: (hits, misses)} of this process plus every conversion worker"""
+    totals = {}
+    sources = [worker_pool.cache_counters()] if worker_pool is not None else []
+    if downloader is not None:
+        sources.append(downloader.cache_counters())
+    for counters in sources:
+        for name, (hits, misses) in counters.items():
+            total = totals.setdefault(name, [0, 0])
+            total[0] += hits
+            total[1] += misses
+    return totals
+
+registry.gauge("ytdl_slots_active", "Requests holding a slot, per pool", ["pool"], lambda: slot_usage("active"))
+registry.gauge("ytdl_slots_waiting", "Requests queued for a slot, per pool", ["pool"], lambda: slot_usage("waiting"))
+registry.gauge("ytdl_executor_queue_depth", "Calls submitted to a thread pool but not started", ["executor"],
+               lambda: {("conversion",): executor_queued[executor], ("info",): executor_queued[info_executor],
+                        ("poster",): executor_queued[poster_executor]})
+registry.gauge("ytdl_worker_processes", "Conversion worker processes by state", ["state"],
+               lambda: {(state,): worker_pool.stats()[state] for state in ("busy", "idle")})
+registry.gauge("ytdl_stage_active", "Conversions holding a download / postprocess slot", ["stage"],
+               lambda: {(stage,): s["active"] for stage, s in stage_gate().stats().items()})
+registry.gauge("ytdl_stage_waiting", "Conversions queued for a download / postprocess slot", ["stage"],
+               lambda: {(stage,): s["waiting"] for stage, s in stage_gate().stats().items()})
+registry.gauge("ytdl_jobs_pending", "Queued and running background jobs", ["kind", "status"], lambda: job_store.counts())
+registry.counter_func("ytdl_cache_hits_total", "Cache hits", ["cache"],
+                      lambda: {(name,): hits for name, (hits, _) in cache_counters().items()})
+registry.counter_func("ytdl_cache_misses_total", "Cache misses", ["cache"],
+                      lambda: {(name,): misses for name, (_, misses) in cache_counters().items()})
+registry.gauge("ytdl_cache_hit_ratio", "Cache hits / lookups", ["cache"],
+               lambda: {(name,): hits / (hits + misses) for name, (hits, misses) in cache_counters().items() if hits + misses})
+
+def stage_gate():
+    return worker_pool.stages if worker_pool is not None else get_downloader().stages
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition"""
+    # Gauges read SQLite (job counts) and worker stats, so render off the event loop
+    return Response(content=await asyncio.to_thread(registry.render), media_type=CONTENT_TYPE)
+
+# Conversions run in long-lived worker processes (one per core by default); 0 keeps them in-process.
+# Each process runs up to WORKER_CONCURRENCY calls at once, by default enough for every conversion
+# admitted by conversion_slots to be in a worker, so the download / FFmpeg stage slots set the limits
+CONVERSION_PROCESSES = int(os.environ.get("CONVERSION_PROCESSES", os.cpu_count() or 1))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", -(-CONVERSION_WORKERS // max(CONVERSION_PROCESSES, 1))))
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", 50))
+WORKER_MAX_RSS_MB = int(os.environ.get("WORKER_MAX_RSS_MB", 1024))
+worker_pool = None
+
+def call_downloader(method, *args, progress=None, **kwargs):
+    """Runs a YouTubeDownloader method in the worker pool (or in-process when the pool is disabled)"""
+    if worker_pool is None:
+        return getattr(get_downloader(), method)(*args, progress=progress, **kwargs)
+    return worker_pool.call(method, *args, progress=progress, **kwargs)
+
+TIMED_PHASES = ("extract", "download", "merge", "transcode", "postprocess", "move")
+phase_seconds = registry.histogram("ytdl_phase_seconds", "Time spent in each conversion phase", ["format", "phase"])
+job_seconds = registry.histogram("ytdl_job_seconds", "End-to-end conversion time", ["format"])
+jobs_total = registry.counter("ytdl_jobs_total", "Finished conversions by format and outcome", ["format", "outcome"])
+job_failures = registry.counter("ytdl_job_failures_total", "Failed conversions by format and reason", ["format", "reason"])
+downloaded_bytes = registry.counter("ytdl_downloaded_bytes_total", "Bytes fetched from YouTube", ["format"])
+written_bytes = registry.counter("ytdl_written_bytes_total", "Bytes of finished output files", ["format"])
+
+def result_files(result):
+    """Output files of a run_* result (one, or one per quality for fan-out)"""
+    items = result.get("results", {}).values() if "results" in result else [result]
+    return [item["file_path"] for item in items if item.get("success") and item.get("file_path")]
+
+def failure_reason(result):
+    """job_failures reason for a failed run_* result: "partial" when some outputs made it, else "failed"
+    (raised errors are labelled by exception class), so the label set stays small"""
+    items = result.get("results", {}).values()
+    if any(item.get("success") for item in items) or result.get("done") or result.get("skipped"):
+        return "partial"
+    return "failed"
+
+def instrumented(job_format, timed_phases=TIMED_PHASES):
+    """Records phase latencies (timed from the progress events a worker relays over its pipe), outcome,
+    failure reason and bytes for a blocking run_* function; job_format(*args) gives its format label.
+    timed_phases=() skips the phase histogram (jobs whose parts run concurrently have no single phase)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def run(*args, progress=None):
+            fmt = job_format(*args)
+            timer = PhaseTimer(phase_seconds, timed_phases, progress, format=fmt)
+            started = time.monotonic()
+            try:
+                result = fn(*args, progress=timer)
+            except Exception as e:
+                jobs_total.inc(format=fmt, outcome="failure")
+                job_failures.inc(format=fmt, reason=type(e).__name__)
+                raise
+            finally:
+                timer.finish()
+                job_seconds.observe(time.monotonic() - started, format=fmt)
+            downloaded_bytes.inc(timer.downloaded_bytes, format=fmt)
+            if result.get("success"):
+                jobs_total.inc(format=fmt, outcome="success")
+            else:
+                jobs_total.inc(format=fmt, outcome="failure")
+                job_failures.inc(format=fmt, reason=failure_reason(result))
+            for path in result_files(result):
+                try:
+                    written_bytes.inc(os.path.getsize(path), format=fmt)
+                except OSError:
+                    pass
+            return result
+        return run
+    return decorate
+
+def is_audio_quality(quality):
+    """mp3 / mp3-<kbps> (transcoded) or a passthrough audio profile (m4a, opus, audio)"""
+    return isinstance(quality, str) and YouTubeDownloader.is_audio_quality(quality)
+
+@instrumented(lambda url, quality, output_path: get_downloader().audio_profile(quality)[0]
+              if is_audio_quality(quality) else "mp4-1080")
+def run_download(url, quality, output_path, progress=None):
+    """Blocking conversion shared by /download and the job workers"""
+    sys.stderr.write(f"[/download] output_path={output_path}\n")
+    # Temporary simplified: MP3 is always 320kbps and MP4 always 1080p whatever the quality value;
+    # passthrough audio profiles (m4a, opus, audio) are remuxed without re-encoding
+    # Reuse a metadata-cache hit from /info; otherwise the worker extracts on its own
+    info = get_downloader().peek_cached_video_info(url)
+    try:
+        if is_audio_quality(quality):
+            result = call_downloader("download_audio", url, quality, output_path, info=info, progress=progress)
+        else:
+            result = call_downloader("download_mp4_with_sound", url, 1080, output_path, info=info, progress=progress)  # always 1080p
+    except RuntimeError as e:
+        sys.stderr.write(f"[/download] worker error: {e}\n")
+        return {"success": False, "message": "Conversion failed"}
+    sys.stderr.write(f"[/download] result={result}\n")
+    if isinstance(result, tuple) and result[0]:
+        file_path, original_filename = result
+        return {"success": True, "file_path": file_path, "original_filename": original_filename}
+    if result is None or not isinstance(result, tuple):
+        msg = "MP3 conversion or move failed"
+        if isinstance(result, dict) and result.get("message"):
+            msg = result["message"]
+        return {"success": False, "message": msg}
+    return {"success": False, "message": "Conversion failed"}
+
+@instrumented(lambda url, qualities, output_path: "variants")
+def run_download_variants(url, qualities, output_path, progress=None):
+    """Blocking fan-out conversion: every audio quality from one download and one FFmpeg run"""
+    info = get_downloader().peek_cached_video_info(url)
+    try:
+        results = call_downloader("download_audio_variants", url, qualities, output_path, info=info, progress=progress)
+    except RuntimeError as e:
+        sys.stderr.write(f"[/download] worker error: {e}\n")
+        return {"success": False, "message": "Conversion failed"}
+    return {
+        "success": all(results.values()),
+        "results": {
+            quality: {"success": True, "file_path": result[0], "original_filename": result[1]} if result
+            else {"success": False, "message": "Conversion failed"}
+            for quality, result in results.items()
+        },
+    }
+
+@instrumented(lambda url, output_path: "poster")
+def run_poster(url, output_path, progress=None):
+    """Blocking poster download shared by /poster and the job workers"""
+    # Temporary simplified: always maxresdefault (1280x720)
+    result = call_downloader("download_poster", url, "maxresdefault", output_path,
+                             info=get_downloader().peek_cached_video_info(url), progress=progress)
+    if isinstance(result, tuple) and result[0]:
+        file_path, original_filename = result
+        return {"success": True, "file_path": file_path, "original_filename": original_filename}
+    return {"success": False, "message": "Poster failed"}
+
 @app.post("/download")
 @limiter.limit("5/minute")
 async def download(request: Request):
@@ -34,30 +357,47 @@ async def download(request: Request):
     quality = data.get("quality")
     output_path = data.get("output_path", "downloads")
     print(f"Received quality (type only): {quality}")
-    if not url or not quality:
+    qualities = data.get("qualities")
+    # {"qualities": [...]} (fan-out) stands in for "quality"
+    if not url or not (quality or qualities):
         return {"success": False, "message": "Missing required fields"}
+    url = canonical_url(url)
+    if not url:
+        return {"success": False, "message": "Invalid YouTube video URL"}
+    if qualities:
+        return await download_variants(url, qualities, output_path)
 
-    # Temporary simplified: ignore incoming quality value, use fixed defaults
-    def run_download():
-        import sys
-        sys.stderr.write(f"[/download] output_path={output_path}\n")
-        if quality == "mp3" or (isinstance(quality, str) and quality.startswith("mp3-")):
-            result = downloader.download_mp3(url, output_path, "320")  # always 320kbps
-        else:
-            result = downloader.download_mp4_with_sound(url, 1080, output_path)  # always 1080p
-        sys.stderr.write(f"[/download] result={result}\n")
-        if isinstance(result, tuple) and result[0]:
-            file_path, original_filename = result
-            return {"success": True, "file_path": file_path, "original_filename": original_filename}
-        if result is None or not isinstance(result, tuple):
-            msg = "MP3 conversion or move failed"
-            if isinstance(result, dict) and result.get("message"):
-                msg = result["message"]
-            return {"success": False, "message": msg}
-        return {"success": False, "message": "Conversion failed"}
+    profile = ("audio", get_downloader().audio_profile(quality)[0]) if is_audio_quality(quality) else ("mp4", "1080")
+    key = (get_downloader().video_cache_key(url), output_path) + profile
+    result, shared = await conversions.do(
+        key, lambda: run_bounded(executor, conversion_slots, CONVERSION_QUEUE_TIMEOUT,
+                                 run_download, url, quality, output_path)
+    )
+    if shared and result.get("success"):
+        file_path = await asyncio.to_thread(get_downloader().share_final_file, result["file_path"])
+        result = {**result, "file_path": file_path}
+    return result
 
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(executor, run_download)
+async def download_variants(url, qualities, output_path):
+    """/download with "qualities": [...] — several audio outputs from one source download"""
+    if not isinstance(qualities, list) or not all(is_audio_quality(q) for q in qualities):
+        return {"success": False, "message": "qualities must be a list of audio qualities"}
+    key = (get_downloader().video_cache_key(url), output_path, "variants") + tuple(sorted(set(qualities)))
+    result, shared = await conversions.do(
+        key, lambda: run_bounded(executor, conversion_slots, CONVERSION_QUEUE_TIMEOUT,
+                                 run_download_variants, url, qualities, output_path)
+    )
+    # A leader failure ({"success": False, "message": ...}, no "results") is passed on unchanged;
+    # partial successes still give each follower its own copy of the files that did convert
+    if shared and "results" in result:
+        results = {}
+        for quality, item in result["results"].items():
+            if item.get("success"):
+                file_path = await asyncio.to_thread(get_downloader().share_final_file, item["file_path"])
+                item = {**item, "file_path": file_path}
+            results[quality] = item
+        result = {**result, "results": results}
+    return result
 
 @app.post("/poster")
 @limiter.limit("5/minute")
@@ -67,17 +407,319 @@ async def poster(request: Request):
     output_path = data.get("output_path", "downloads")
     if not url:
         raise HTTPException(status_code=400, detail="URL required")
+    url = require_video_url(url)
+    return await run_bounded(executor, conversion_slots, CONVERSION_QUEUE_TIMEOUT, run_poster, url, output_path)
 
-    # Temporary simplified: always maxresdefault (1280x720)
-    def run_poster():
-        result = downloader.download_poster(url, "maxresdefault", output_path)
-        if isinstance(result, tuple):
-            file_path, original_filename = result
-            return {"success": True, "file_path": file_path, "original_filename": original_filename}
-        return {"success": False, "message": "Poster failed"}
-
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(executor, run_poster)
+POSTER_MAX_AGE = int(os.environ.get("POSTER_MAX_AGE", 86400))
+
+def load_poster(url, width, fmt):
+    """Blocking poster_variant lookup plus read; retried once if the entry is evicted in between"""
+    for _ in range(2):
+        result = get_downloader().poster_variant(url, width, fmt)
+        if not result:
+            return None
+        data_path, meta = result
+        try:
+            with open(data_path, "rb") as f:
+                return f.read(), meta
+        except OSError:
+            continue
+    return None
+
+def not_modified(request, meta):
+    """True when the client's If-None-Match / If-Modified-Since validators still match"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or meta["etag"] in tags or f"W/{meta['etag']}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(meta["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+@app.get("/poster")
+@limiter.limit("120/minute")
+async def poster_image(request: Request, url: str, w: int = 0, format: str = "jpeg"):
+    """Poster image from the poster cache: optional width `w` and format jpeg|webp|avif|auto (by Accept),
+    with ETag / Last-Modified validation"""
+    url = require_video_url(url)
+    downloader = get_downloader()
+    if format == "auto":
+        accept = request.headers.get("accept", "")
+        supported = downloader.poster_formats()
+        fmt = next((f for f in ("avif", "webp") if f in supported and f"image/{f}" in accept), "jpeg")
+    elif format in downloader.POSTER_FORMATS:
+        fmt = format
+    else:
+        raise HTTPException(status_code=400, detail="format must be jpeg, webp, avif or auto")
+    if w < 0:
+        raise HTTPException(status_code=400, detail="w must be positive")
+    result = await run_bounded(poster_executor, poster_slots, POSTER_QUEUE_TIMEOUT, load_poster, url, w or None, fmt)
+    if not result:
+        raise HTTPException(status_code=404, detail="Poster not found")
+    data, meta = result
+    headers = {
+        "ETag": meta["etag"],
+        "Last-Modified": formatdate(meta["last_modified"], usegmt=True),
+        "Cache-Control": f"public, max-age={POSTER_MAX_AGE}",
+    }
+    if format == "auto":
+        headers["Vary"] = "Accept"
+    if not_modified(request, meta):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = content_disposition("inline", meta["filename"])
+    return Response(content=data, media_type=meta["content_type"], headers=headers)
+
+# Streaming conversions hold a slot (and an FFmpeg process) for as long as the client is reading
+STREAM_MAX_CONCURRENT = int(os.environ.get("STREAM_MAX_CONCURRENT", 4))
+STREAM_CHUNK_SIZE = 64 * 1024
+stream_slots = Slots(STREAM_MAX_CONCURRENT)
+
+@app.get("/stream")
+@limiter.limit("5/minute")
+async def stream(request: Request, url: str, quality: str = "mp3"):
+    """Pipes FFmpeg output straight into a chunked response: no temp file, no final/ round trip"""
+    url = require_video_url(url)
+    try:
+        await asyncio.wait_for(stream_slots.acquire(), timeout=CONVERSION_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, try again later")
+    process = None
+    try:
+        opened = await asyncio.to_thread(get_downloader().open_stream, url, quality)
+        if not opened:
+            raise HTTPException(status_code=502, detail="Unable to start stream")
+        process = opened["process"]
+        # Wait for the first bytes so an FFmpeg failure becomes a 502 instead of an empty 200
+        first = await asyncio.to_thread(process.stdout.read, STREAM_CHUNK_SIZE)
+        if not first:
+            raise HTTPException(status_code=502, detail="Stream produced no data")
+    except BaseException:
+        if process is not None and process.poll() is None:
+            process.kill()
+        stream_slots.release()
+        raise
+
+    async def body():
+        try:
+            chunk = first
+            while chunk:
+                yield chunk
+                chunk = await asyncio.to_thread(process.stdout.read, STREAM_CHUNK_SIZE)
+        finally:
+            if process.poll() is None:
+                process.kill()  # client went away mid-stream
+            await asyncio.to_thread(process.wait)
+            stream_slots.release()
+
+    return StreamingResponse(body(), media_type=opened["media_type"],
+                             headers={"Content-Disposition": content_disposition("attachment", opened["filename"])})
+
+def content_disposition(kind, filename):
+    """Content-Disposition with an ASCII fallback name plus the UTF-8 original"""
+    ascii_name = get_downloader().sanitize_filename(filename) or "download"
+    return f"{kind}; filename=\"{ascii_name}\"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+
+# Per-job progress events, streamed to clients by GET /jobs/{id}/events
+broker = ProgressBroker()
+JOB_STALL_SECONDS = float(os.environ.get("JOB_STALL_SECONDS", 60))
+SSE_KEEPALIVE_SECONDS = 15
+# Coarse job.progress value reached when a phase starts; download interpolates by bytes
+PHASE_PROGRESS = {"extract": 0.05, "download": 0.1, "merge": 0.9, "transcode": 0.9, "postprocess": 0.9, "move": 0.97}
+
+def run_job(kind, params, job_id):
+    """JobWorkers handler: runs one queued job to completion, publishing its progress"""
+    reached = [0.0]
+
+    def on_progress(event):
+        broker.publish(job_id, event)
+        fraction = PHASE_PROGRESS.get(event["phase"], 0.0)
+        if event["phase"] == "playlist":
+            fraction = event["completed"] / event["total"]
+        total = event.get("total_bytes")
+        if event["phase"] == "download" and total:
+            fraction = 0.1 + 0.8 * min(event.get("downloaded_bytes") or 0, total) / total
+        if fraction > reached[0]:
+            reached[0] = fraction
+            job_store.set_progress(job_id, round(fraction, 3))
+
+    if kind == "poster":
+        return run_poster(params["url"], params["output_path"], progress=on_progress)
+    if kind == "playlist":
+        return run_playlist(params, progress=on_progress)
+    return run_download(params["url"], params["quality"], params["output_path"], progress=on_progress)
+
+PLAYLIST_MAX_WORKERS = int(os.environ.get("PLAYLIST_MAX_WORKERS", 4))
+
+# Entries convert in parallel, so phases overlap: only the end-to-end time and outcome are recorded
+@instrumented(lambda params: "playlist-" + (get_downloader().audio_profile(params["quality"])[0]
+                                             if is_audio_quality(params["quality"]) else "mp4"),
+              timed_phases=())
+def run_playlist(params, progress=None):
+    """Blocking playlist batch conversion; entries run in parallel inside one worker"""
+    try:
+        return call_downloader(
+            "download_playlist_batch", params["url"], params["quality"], params["output_path"],
+            max_workers=params["max_workers"], target_seconds=params["target_seconds"], progress=progress,
+        )
+    except RuntimeError as e:
+        return {"success": False, "message": str(e)}
+
+# Queued conversions (POST /jobs) persist in SQLite and are pulled by per-format worker threads
+JOBS_DB = os.environ.get("JOBS_DB", os.path.join(DOWNLOADS_DIR, "jobs.sqlite3"))
+JOB_WORKERS = {
+    "mp3": int(os.environ.get("JOB_WORKERS_MP3", 2)),
+    "mp4": int(os.environ.get("JOB_WORKERS_MP4", 2)),
+    "poster": int(os.environ.get("JOB_WORKERS_POSTER", 2)),
+    "playlist": int(os.environ.get("JOB_WORKERS_PLAYLIST", 1)),
+}
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", 24 * 3600))
+job_store = None
+job_workers = None
+
+# Created on startup, not at import: spawned worker processes may re-import this module
+@app.on_event("startup")
+async def start_workers():
+    global worker_pool, job_store, job_workers
+    if CONVERSION_PROCESSES > 0:
+        worker_pool = ProcessWorkerPool(CONVERSION_PROCESSES, max_jobs=WORKER_MAX_JOBS, max_rss_mb=WORKER_MAX_RSS_MB,
+                                        stages=StageGate(), concurrency=WORKER_CONCURRENCY)
+    job_store = JobStore(JOBS_DB)
+    job_workers = JobWorkers(job_store, run_job, JOB_WORKERS, retention=JOB_RETENTION,
+                             on_finish=lambda job_id, result: broker.close(job_id))
+    job_workers.start()
+    # Don't hold up readiness for yt_dlp: warm it in the background while requests are already accepted
+    threading.Thread(target=warm_up, name="preload", daemon=True).start()
+
+def warm_up():
+    get_downloader().preload()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    job_workers.stop()
+    if worker_pool is not None:
+        worker_pool.close()
+    if downloader is not None:
+        downloader.ydl_pool.close()
+
+@app.post("/jobs")
+@limiter.limit("5/minute")
+async def submit_job(request: Request):
+    data = await request.json()
+    url = data.get("url")
+    quality = data.get("quality")
+    output_path = data.get("output_path", "downloads")
+    if not url or not quality:
+        raise HTTPException(status_code=400, detail="url and quality required")
+    url = require_video_url(url)
+    if quality == "poster":
+        kind = "poster"
+    else:
+        kind = "mp3" if is_audio_quality(quality) else "mp4"  # all audio profiles share the mp3 workers
+    job_id = await asyncio.to_thread(job_store.submit, kind, {"url": url, "quality": quality, "output_path": output_path})
+    job_workers.notify()
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+@app.post("/playlist")
+@limiter.limit("2/minute")
+async def submit_playlist(request: Request):
+    """Queues a whole playlist; progress is reported per entry on GET /jobs/{id}/events"""
+    data = await request.json()
+    url = data.get("url")
+    quality = data.get("quality", "mp3")
+    if not url:
+        raise HTTPException(status_code=400, detail="url required")
+    if not playlist_id(url):
+        raise HTTPException(status_code=400, detail="Invalid YouTube playlist URL")
+    target_seconds = data.get("target_seconds")
+    try:
+        max_workers = max(1, min(int(data.get("max_workers", PLAYLIST_MAX_WORKERS)), PLAYLIST_MAX_WORKERS))
+        target_seconds = float(target_seconds) if target_seconds else None
+    except (TypeError, ValueError, OverflowError):
+        return JSONResponse(status_code=400, content={"success": False, "message": "max_workers and target_seconds must be numbers"})
+    if target_seconds is not None and not 0 < target_seconds < float("inf"):
+        return JSONResponse(status_code=400, content={"success": False, "message": "target_seconds must be a positive number"})
+    params = {
+        "url": url,
+        "quality": quality if is_audio_quality(quality) else "mp4",
+        "output_path": data.get("output_path", "downloads"),
+        "max_workers": max_workers,
+        "target_seconds": target_seconds,
+    }
+    job_id = await asyncio.to_thread(job_store.submit, "playlist", params)
+    job_workers.notify()
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+def job_status(job):
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events: `progress` (phase, bytes, speed, ETA), `stalled`, and a final `done` with the job status"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        if job["status"] in ("done", "failed"):
+            yield sse("done", job_status(job))
+            return
+        q = broker.subscribe(job_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(q.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    current = await asyncio.to_thread(job_store.get, job_id)
+                    if current["status"] in ("done", "failed"):
+                        yield sse("done", job_status(current))
+                        return
+                    last = broker.updated_at(job_id) or current["started_at"]
+                    if current["status"] == "running" and last and time.time() - last > JOB_STALL_SECONDS:
+                        yield sse("stalled", {"job_id": job_id, "seconds_since_progress": round(time.time() - last)})
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    yield sse("done", job_status(await asyncio.to_thread(job_store.get, job_id)))
+                    return
+                yield sse("progress", event)
+        finally:
+            broker.unsubscribe(job_id, q)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(status_code=202, content=job_status(job))
+    return job["result"]
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """In-process LRU + TTL cache for extracted video metadata (thread-safe)"""
+
+    def __init__(self, max_entries=512, ttl=1800, negative_ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl  # Failed extractions (value None) expire sooner
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns (found, value). A cached failure is returned as (True, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        """Stores value; None is cached as a negative entry with the shorter TTL"""
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Returns hit/miss/eviction counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class ResultCache:
+    """On-disk cache of converted files keyed by (video ID, output profile), LRU-evicted by total bytes.
+    Entries are written via temp file + os.replace, so readers in any process never see partial files."""
+
+    def __init__(self, cache_dir, max_bytes=5 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _paths(self, video_id, profile):
+        base = os.path.join(self.cache_dir, f"{video_id}.{profile}")
+        return base + ".bin", base + ".json"
+
+    def get(self, video_id, profile):
+        """Returns (data_path, meta) for a cached artifact, or None. Bumps the entry's LRU position."""
+        data_path, meta_path = self._paths(video_id, profile)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(data_path)  # mtime doubles as last-access time for eviction
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data_path, meta
+
+    def put(self, video_id, profile, src_path, meta):
+        """Stores src_path (hardlinked when possible, else copied) with its metadata, then evicts over budget"""
+        data_path, meta_path = self._paths(video_id, profile)
+        tmp_suffix = f".{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(src_path, data_path + tmp_suffix)
+            except OSError:
+                shutil.copyfile(src_path, data_path + tmp_suffix)
+            os.replace(data_path + tmp_suffix, data_path)
+            with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_path + tmp_suffix, meta_path)
+        except OSError as e:
+            sys.stderr.write(f"Result cache write failed for {video_id}.{profile}: {e}\n")
+            for leftover in (data_path + tmp_suffix, meta_path + tmp_suffix):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.bin'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            for victim in (path, path[:-len('.bin')] + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        """Returns hit/miss/eviction counters and current size"""
+        size = 0
+        entries = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.bin'):
+                entries += 1
+                try:
+                    size += os.path.getsize(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""One-pass index over an info dict's formats list.
+
+Resolution listing, format selection and size estimation all need the same facts about a video's
+formats (height bucket, codec, container, bitrate, size). FormatIndex reads the formats list once
+and keeps those facts; format_index() memoizes it inside the info dict under a '__' key, which
+yt-dlp's sanitize_info(remove_private_keys=True) drops before the dict reaches a download."""
+
+STANDARD_RESOLUTIONS = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+LISTED_RESOLUTIONS = tuple(r for r in STANDARD_RESOLUTIONS if 360 <= r <= 2160)
+BUCKET_TOLERANCE = 20  # px between a format's height and the standard it counts as
+FALLBACK_TOLERANCE = 50  # looser match, used only when nothing lands within BUCKET_TOLERANCE
+INDEX_KEY = '__format_index'
+
+
+def codec_family(codec):
+    """'avc1.640028' -> 'avc1', 'vp09.00.40.08' -> 'vp9', 'none'/None -> None"""
+    if not codec or codec == 'none':
+        return None
+    family = codec.split('.', 1)[0].lower()
+    return {'vp09': 'vp9', 'av01': 'av1', 'hev1': 'hevc', 'hvc1': 'hevc'}.get(family, family)
+
+
+def nearest_standard(height, standards=STANDARD_RESOLUTIONS):
+    return min(standards, key=lambda r: abs(r - height))
+
+
+class FormatInfo:
+    """The facts the backend uses about one format"""
+    __slots__ = ('format_id', 'height', 'bucket', 'vcodec', 'acodec', 'ext', 'tbr', 'abr', 'filesize', 'protocol',
+                 'has_video', 'has_audio')
+
+    def __init__(self, f, duration):
+        self.format_id = f.get('format_id')
+        self.height = f.get('height') or 0
+        self.bucket = None
+        self.vcodec = codec_family(f.get('vcodec'))
+        self.acodec = codec_family(f.get('acodec'))
+        self.ext = f.get('ext')
+        self.tbr = f.get('tbr') or 0
+        # A missing vcodec with a height still counts as video (yt-dlp leaves codecs unset for some muxed formats)
+        self.has_video = f.get('vcodec') != 'none' and self.height > 0
+        self.has_audio = bool(self.acodec)
+        self.abr = f.get('abr') or (self.tbr if not self.has_video else 0)
+        self.protocol = f.get('protocol') or ''
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and self.tbr and duration:
+            size = int(self.tbr * 1000 / 8 * duration)
+        self.filesize = size or None
+
+
+class FormatIndex:
+    """Formats of one video grouped by standard-resolution bucket, built in a single pass"""
+
+    def __init__(self, info):
+        duration = info.get('duration') or 0
+        self.videos = {}  # bucket -> [FormatInfo] (video-only and muxed), best first
+        self.progressive = []  # formats carrying both video and audio, best first
+        self.audios = []  # audio-only formats, best first
+        heights = set()
+        unbucketed = []
+        for f in info.get('formats') or ():
+            fmt = FormatInfo(f, duration)
+            if not fmt.format_id or fmt.protocol.startswith('mhtml'):
+                continue  # storyboards
+            if fmt.has_video:
+                heights.add(fmt.height)
+                std = nearest_standard(fmt.height)
+                if abs(std - fmt.height) <= BUCKET_TOLERANCE:
+                    fmt.bucket = std
+                    self.videos.setdefault(std, []).append(fmt)
+                else:
+                    unbucketed.append(fmt)
+                if fmt.has_audio:
+                    self.progressive.append(fmt)
+            elif fmt.has_audio:
+                self.audios.append(fmt)
+
+        listed = [r for r in self.videos if r in LISTED_RESOLUTIONS]
+        if not listed:
+            # No height close to a standard: accept the nearest standard within the looser tolerance
+            for fmt in unbucketed:
+                if LISTED_RESOLUTIONS[0] <= fmt.height <= LISTED_RESOLUTIONS[-1]:
+                    std = nearest_standard(fmt.height, LISTED_RESOLUTIONS)
+                    if abs(std - fmt.height) <= FALLBACK_TOLERANCE:
+                        fmt.bucket = std
+                        self.videos.setdefault(std, []).append(fmt)
+                        listed.append(std)
+        self.heights = sorted(heights, reverse=True)
+        self.resolutions = sorted(set(listed), reverse=True)
+
+        for formats in self.videos.values():
+            formats.sort(key=lambda fmt: (fmt.height, fmt.tbr), reverse=True)
+        self.progressive.sort(key=lambda fmt: (fmt.height, fmt.tbr), reverse=True)
+        self.audios.sort(key=lambda fmt: fmt.abr, reverse=True)
+
+    def best_bucket(self, max_height):
+        """The highest listed resolution at or below max_height (or the lowest one when none is)"""
+        if not self.resolutions:
+            return None
+        return next((r for r in self.resolutions if r <= max_height), self.resolutions[-1])
+
+    def best_video(self, max_height, ext=None, vcodec=None):
+        """Best video format in the best bucket at or below max_height, optionally by container / codec"""
+        for bucket in sorted((b for b in self.videos if b <= max_height), reverse=True):
+            for fmt in self.videos[bucket]:
+                if (ext is None or fmt.ext == ext) and (vcodec is None or fmt.vcodec == vcodec):
+                    return fmt
+        return None
+
+    def best_audio(self, ext=None, acodec=None):
+        for fmt in self.audios:
+            if (ext is None or fmt.ext == ext) and (acodec is None or fmt.acodec == acodec):
+                return fmt
+        return None
+
+    def best_progressive(self, max_height, ext=None):
+        for fmt in self.progressive:
+            if fmt.height <= max_height + BUCKET_TOLERANCE and (ext is None or fmt.ext == ext):
+                return fmt
+        return None
+
+    def select_mp4(self, max_height):
+        """Picks the streams for an MP4 at or below max_height, preferring pairs FFmpeg can stream-copy into
+        MP4 with maximum player compatibility. Returns (format_id spec or None, reason). Ladder:
+        avc1 + mp4a (highest bucket that has avc1), progressive avc1/mp4a MP4 (no merge at all),
+        any video + mp4a, any video + any audio."""
+        best = self.best_video(max_height)
+        if not best:
+            return None, 'no video formats at or below the requested height'
+        aac = self.best_audio(acodec='mp4a')
+        avc = self.best_video(max_height, vcodec='avc1')
+        if avc and aac:
+            reason = f'avc1 {avc.height}p + mp4a {aac.abr:.0f}k, stream copy into MP4'
+            if avc.bucket != best.bucket:
+                reason += f' (no avc1 at {best.bucket}p, only {best.vcodec})'
+            return f'{avc.format_id}+{aac.format_id}', reason
+        progressive = self.best_progressive(max_height, ext='mp4')
+        if progressive and progressive.vcodec in (None, 'avc1'):
+            return progressive.format_id, f'progressive MP4 {progressive.height}p, no merge needed (no avc1+mp4a pair)'
+        audio = aac or self.best_audio()
+        if best.has_audio:
+            return best.format_id, f'{best.vcodec} {best.height}p with its own audio (no separate audio stream)'
+        if not audio:
+            return best.format_id, f'{best.vcodec} {best.height}p without audio (no audio formats)'
+        reason = f'{best.vcodec} {best.height}p + {audio.acodec}, stream copy into MP4 (no avc1 video'
+        reason += ')' if audio is aac else ' and no mp4a audio)'
+        return f'{best.format_id}+{audio.format_id}', reason
+
+    def estimate_size(self, max_height=None):
+        """Approximate bytes of the best download at max_height (video + audio), or of the best audio
+        alone when max_height is None. None when the formats carry no size or bitrate."""
+        audio = self.best_audio()
+        if max_height is None:
+            return audio.filesize if audio else None
+        video = self.best_video(max_height)
+        if not video:
+            return None
+        if video.has_audio:
+            return video.filesize
+        if not video.filesize:
+            return None
+        return video.filesize + ((audio.filesize or 0) if audio else 0)
+
+    def sizes(self):
+        """{resolution: estimated bytes} for every listed resolution with a known size"""
+        sizes = {}
+        for res in self.resolutions:
+            size = self.estimate_size(res)
+            if size:
+                sizes[res] = size
+        return sizes
+
+
+def format_index(info):
+    """FormatIndex for info, built on first use and memoized in the info dict"""
+    if not info:
+        return FormatIndex({})
+    index = info.get(INDEX_KEY)
+    if index is None:
+        index = FormatIndex(info)
+        try:
+            info[INDEX_KEY] = index
+        except TypeError:
+            pass
+    return index
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+
+class JobStore:
+    """SQLite-backed job queue. Jobs left 'running' by a dead worker are re-queued on startup."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # downloads/ only exists once a YouTubeDownloader has been built, which now happens on first use
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, kind, created_at)")
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued', progress = 0, started_at = NULL WHERE status = 'running'"
+        ).rowcount
+        if requeued:
+            sys.stderr.write(f"[jobs] re-queued {requeued} interrupted job(s)\n")
+
+    def _conn(self):
+        """One connection per thread; autocommit mode so transactions are explicit"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def submit(self, kind, params):
+        """Queues a job and returns its ID"""
+        job_id = uuid.uuid4().hex
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(params, ensure_ascii=False), time.time()),
+        )
+        return job_id
+
+    def claim(self, kind):
+        """Atomically moves the oldest queued job of this kind to 'running'. Returns (job_id, params) or None."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' AND kind = ? ORDER BY created_at LIMIT 1",
+                (kind,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (time.time(), row['id']),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row['id'], json.loads(row['params'])
+
+    def set_progress(self, job_id, progress):
+        self._conn().execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def finish(self, job_id, result):
+        """Marks a job done (or failed, when result says success: False) and stores its result"""
+        status = 'done' if result.get('success') else 'failed'
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, progress = 1, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result, ensure_ascii=False), result.get('message') if status == 'failed' else None,
+             time.time(), job_id),
+        )
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None"""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def counts(self):
+        """{(kind, status): count} of queued and running jobs"""
+        rows = self._conn().execute(
+            "SELECT kind, status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY kind, status"
+        ).fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def purge(self, older_than):
+        """Deletes finished jobs older than `older_than` seconds"""
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - older_than,),
+        ).rowcount
+
+
+class JobWorkers:
+    """Worker threads pulling jobs from a JobStore, with a separate parallelism limit per job kind.
+    With retention, finished jobs older than that many seconds are purged every purge_interval seconds."""
+
+    def __init__(self, store, handler, parallelism, poll_interval=1.0, on_finish=None, retention=None,
+                 purge_interval=3600.0):
+        self.store = store
+        self.handler = handler  # handler(kind, params, job_id) -> result dict
+        self.on_finish = on_finish  # on_finish(job_id, result), called once the result is stored
+        self.parallelism = parallelism  # {'mp3': 2, 'mp4': 2, ...}
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0  # monotonic time of the next purge; 0 purges on the first pass
+        self._purge_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for kind, count in self.parallelism.items():
+            for i in range(count):
+                t = threading.Thread(target=self._run, args=(kind,), name=f"job-{kind}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """Wakes idle workers after a submit instead of waiting for the next poll"""
+        self._wakeup.set()
+
+    def _purge_due(self):
+        """Purges old finished jobs if purge_interval has passed; one worker does it, the rest skip"""
+        if self.retention is None:
+            return
+        now = time.monotonic()
+        with self._purge_lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        try:
+            purged = self.store.purge(self.retention)
+        except sqlite3.Error:
+            traceback.print_exc(file=sys.stderr)
+            return
+        if purged:
+            sys.stderr.write(f"[jobs] purged {purged} finished job(s)\n")
+
+    def _run(self, kind):
+        while not self._stopping.is_set():
+            self._purge_due()
+            try:
+                claimed = self.store.claim(kind)
+            except sqlite3.Error:
+                traceback.print_exc(file=sys.stderr)
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            job_id, params = claimed
+            try:
+                result = self.handler(kind, params, job_id)
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                result = {"success": False, "message": str(e) or "Job failed"}
+            self.store.finish(job_id, result)
+            if self.on_finish:
+                self.on_finish(job_id, result)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Minimal Prometheus text-format metrics (exposition format 0.0.4), no client library needed.
+
+Counters and histograms are updated in place; gauges are read from callbacks at scrape time, so
+queue depths and cache counters come straight from the objects that own them."""
+import math
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Seconds; conversions range from sub-second cache hits to multi-minute 4K merges
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_labels(self.label_names, k)} {_number(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose samples come from callback() -> {label values tuple: value} (or a bare number)"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def render(self):
+        try:
+            samples = self.callback()
+        except Exception:
+            return []  # owner not ready yet (e.g. before startup)
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        lines = self.header()
+        for key, value in sorted(samples.items()):
+            if value is not None:
+                lines.append(f'{self.name}{_labels(self.label_names, key)} {_number(value)}')
+        return lines
+
+
+class CounterFunc(Gauge):
+    """Counter read from callback() at scrape time, for totals another object already keeps"""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self.register(Gauge(name, help, labels, callback))
+
+    def counter_func(self, name, help, labels=(), callback=None):
+        return self.register(CounterFunc(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+class PhaseTimer:
+    """Progress callback wrapper that times each phase of a job from its progress events.
+
+    A phase lasts from its first event until the next timed phase starts (or finish()); events of
+    other phases (e.g. 'select') pass through without ending the current one. Also sums the bytes
+    of finished downloads. Forwards every event to progress when given."""
+
+    def __init__(self, histogram, phases, progress=None, **labels):
+        self.histogram = histogram
+        self.phases = phases
+        self.progress = progress
+        self.labels = labels
+        self.phase = None
+        self.started = None
+        self.downloaded_bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        phase = event.get('phase')
+        with self._lock:
+            if phase == 'download' and event.get('status') == 'finished':
+                self.downloaded_bytes += event.get('downloaded_bytes') or event.get('total_bytes') or 0
+            if phase in self.phases and phase != self.phase:
+                self._close()
+                self.phase, self.started = phase, time.monotonic()
+        if self.progress:
+            self.progress(event)
+
+    def _close(self):
+        if self.phase is not None:
+            self.histogram.observe(time.monotonic() - self.started, phase=self.phase, **self.labels)
+            self.phase = None
+
+    def finish(self):
+        with self._lock:
+            self._close()
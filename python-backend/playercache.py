@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Disk cache for YouTube player JS and its signature solutions, shared by every process.
+
+yt-dlp already keeps solved signature functions in its `cachedir` (section 'youtube-sigfuncs'),
+but downloads the player script and re-derives the signature timestamp in every new process, and
+its preprocessed-player cache is disabled upstream because it has no rotation. install() fills
+those gaps: player JS, `sts` and the preprocessed player are stored in cachedir, keyed by player
+version, and prune() keeps only the newest few player versions. All writes go through yt-dlp's
+Cache (temp file + rename), so concurrent workers never read partial files."""
+import os
+import re
+import sys
+import threading
+import urllib.parse
+
+PLAYER_SECTION = 'youtube-player'
+# Sections holding per-player-version files -> file name prefix of those entries; prune() rotates them
+# ('challenge-solver' also holds the solver's own scripts, which must survive)
+PER_PLAYER_SECTIONS = {PLAYER_SECTION: '', 'challenge-solver': 'player', 'youtube-sts': ''}
+# Player ID in a cache key: '<id>-<variant>' (player JS, sts) or a player URL '.../s/player/<id>/...'
+# (preprocessed player); one version has several files, one per variant / player URL
+PLAYER_ID = re.compile(r'(?:^|/s/player/)([a-fA-F0-9]{8,})[-/]')
+
+_install_lock = threading.Lock()
+_installed = False
+
+
+def install():
+    """Patches the YouTube extractor (once per process) to persist player data in the yt-dlp cachedir"""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+        try:
+            from yt_dlp.extractor.youtube._video import YoutubeIE
+            from yt_dlp.extractor.youtube.jsc._builtin.ejs import EJSBaseJCP
+            load_player = YoutubeIE._load_player
+            load_data = YoutubeIE._load_player_data_from_cache
+            store_data = YoutubeIE._store_player_data_to_cache
+        except (ImportError, AttributeError) as e:
+            sys.stderr.write(f"[player-cache] unsupported yt-dlp version, disk player cache disabled: {e}\n")
+            return
+
+        def _load_player(self, video_id, player_url, fatal=True):
+            key = self._player_js_cache_key(player_url)
+            if key in self._code_cache:
+                return self._code_cache[key]
+            code = self.cache.load(PLAYER_SECTION, key)
+            if code:
+                self._code_cache[key] = code
+                return code
+            code = load_player(self, video_id, player_url, fatal=fatal)
+            if code:
+                self.cache.store(PLAYER_SECTION, key, code)
+            return code
+
+        # The signature timestamp is fixed per player version — keep it on disk like sigfuncs
+        def _load_player_data_from_cache(self, name, player_url, *cache_keys, use_disk_cache=False):
+            return load_data(self, name, player_url, *cache_keys, use_disk_cache=use_disk_cache or name == 'sts')
+
+        def _store_player_data_to_cache(self, data, name, player_url, *cache_keys, use_disk_cache=False):
+            return store_data(self, data, name, player_url, *cache_keys, use_disk_cache=use_disk_cache or name == 'sts')
+
+        YoutubeIE._load_player = _load_player
+        YoutubeIE._load_player_data_from_cache = _load_player_data_from_cache
+        YoutubeIE._store_player_data_to_cache = _store_player_data_to_cache
+        # Safe to enable now that prune() rotates it
+        EJSBaseJCP._ENABLE_PREPROCESSED_PLAYER_CACHE = True
+
+
+def player_id(name):
+    """Player version a cache file belongs to, or None. yt-dlp's Cache quotes keys with ',' for '%'."""
+    key = urllib.parse.unquote(os.path.splitext(name)[0].replace(',', '%'))
+    m = PLAYER_ID.search(key)
+    return m.group(1) if m else None
+
+
+def prune(cachedir, keep_players=3):
+    """Deletes the files of all but the newest keep_players player versions (by their newest file) in
+    each per-player section. Returns the count removed."""
+    removed = 0
+    for section, prefix in PER_PLAYER_SECTIONS.items():
+        section_dir = os.path.join(cachedir, section)
+        try:
+            names = os.listdir(section_dir)
+        except OSError:
+            continue
+        versions = {}  # player ID -> [newest mtime, [paths]]
+        for name in names:
+            if not name.startswith(prefix) or name.endswith('.tmp'):
+                continue
+            pid = player_id(name)
+            if pid is None:
+                continue  # not a per-player entry; leave it alone
+            path = os.path.join(section_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            version = versions.setdefault(pid, [mtime, []])
+            version[0] = max(version[0], mtime)
+            version[1].append(path)
+        for _, paths in sorted(versions.values(), reverse=True)[keep_players:]:
+            for path in paths:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass  # another process got there first
+    return removed
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class ProgressBroker:
+    """Fans out per-job progress events from worker threads to subscribers on the event loop"""
+
+    def __init__(self, history=20):
+        self.history = history
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> {'events': deque, 'subscribers': set of (loop, queue), 'updated_at': float}
+
+    def _state(self, job_id):
+        return self._jobs.setdefault(job_id, {
+            'events': deque(maxlen=self.history),
+            'subscribers': set(),
+            'updated_at': time.time(),
+        })
+
+    def publish(self, job_id, event):
+        """Thread-safe: records the event and pushes it to every subscriber"""
+        event = {**event, 'ts': time.time()}
+        with self._lock:
+            state = self._state(job_id)
+            state['events'].append(event)
+            state['updated_at'] = event['ts']
+            subscribers = list(state['subscribers'])
+        for loop, q in subscribers:
+            loop.call_soon_threadsafe(q.put_nowait, event)
+
+    def close(self, job_id):
+        """Ends all subscriptions (they receive None) and forgets the job"""
+        with self._lock:
+            state = self._jobs.pop(job_id, None)
+        if state:
+            for loop, q in state['subscribers']:
+                loop.call_soon_threadsafe(q.put_nowait, None)
+
+    def updated_at(self, job_id):
+        """Time of the job's last event, or None if it has none (yet, or any more)"""
+        with self._lock:
+            state = self._jobs.get(job_id)
+            return state['updated_at'] if state else None
+
+    def subscribe(self, job_id):
+        """Returns an asyncio.Queue that receives recent and future events, then None once the job is closed"""
+        q = asyncio.Queue()
+        with self._lock:
+            state = self._state(job_id)
+            for event in state['events']:
+                q.put_nowait(event)
+            state['subscribers'].add((asyncio.get_running_loop(), q))
+        return q
+
+    def unsubscribe(self, job_id, q):
+        with self._lock:
+            state = self._jobs.get(job_id)
+            if state:
+                state['subscribers'] = {(loop, sq) for loop, sq in state['subscribers'] if sq is not q}
+                if not state['subscribers'] and not state['events']:
+                    del self._jobs[job_id]
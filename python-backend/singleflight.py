@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into a single in-flight task (asyncio)"""
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Future
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """Awaits fn() once per key; concurrent callers share its result. Returns (result, shared)."""
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut), True
+        self.leaders += 1
+        fut = asyncio.ensure_future(fn())
+        self._inflight[key] = fut
+        fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a disconnecting first caller must not cancel the work the others are waiting on
+        return await asyncio.shield(fut), False
+
+    def stats(self):
+        """Returns in-flight and coalescing counters"""
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+
+# Network-bound yt-dlp downloading can run wide; CPU-bound FFmpeg work follows the core count
+DOWNLOAD_SLOTS = int(os.environ.get('DOWNLOAD_SLOTS', 8))
+POSTPROCESS_SLOTS = int(os.environ.get('POSTPROCESS_SLOTS', os.cpu_count() or 1))
+
+
+class StageGate:
+    """Separate concurrency limits for the two stages of a conversion: 'download' (network) and
+    'postprocess' (FFmpeg merge / transcode / remux). A job holds one stage slot at a time and moves
+    from the first to the second, so a job waiting on the network never holds a CPU slot and the
+    reverse; jobs waiting for a slot form the queue between the stages.
+
+    Semaphores and counters come from the spawn context, so one gate passed to worker processes at
+    start limits all of them together. Each worker also gets a holder() counting the slots its jobs
+    hold and wait for, so the parent can release() what a crashed worker held."""
+
+    def __init__(self, download_slots=DOWNLOAD_SLOTS, postprocess_slots=POSTPROCESS_SLOTS):
+        ctx = multiprocessing.get_context('spawn')
+        self.limits = {'download': download_slots, 'postprocess': postprocess_slots}
+        self._slots = {stage: ctx.BoundedSemaphore(limit) for stage, limit in self.limits.items()}
+        self._active = {stage: ctx.Value('i', 0) for stage in self.limits}
+        self._waiting = {stage: ctx.Value('i', 0) for stage in self.limits}
+        self.held = None  # this process's holder(), set in worker processes
+
+    def holder(self):
+        """Shared per-worker counts, one pair per stage: [held by stage..., waiting by stage...].
+        Counts, not a single stage, since one worker can run several jobs at once (playlists)"""
+        return multiprocessing.get_context('spawn').Array('i', 2 * len(self.limits))
+
+    def release(self, held):
+        """Frees every slot and waiting place a dead worker left behind in its holder()"""
+        with held.get_lock():
+            counts = held[:]
+            held[:] = [0] * len(counts)
+        for i, stage in enumerate(self.limits):
+            active, waiting = counts[i], counts[len(self.limits) + i]
+            if waiting:
+                self._add(self._waiting[stage], -waiting)
+            if active:
+                self._add(self._active[stage], -active)
+                for _ in range(active):
+                    self._slots[stage].release()
+
+    def ticket(self):
+        """A job's place in the pipeline; enter('download') first, leave() when done (idempotent)"""
+        return StageTicket(self)
+
+    def _add(self, counter, delta):
+        with counter.get_lock():
+            counter.value += delta
+
+    def stats(self):
+        return {
+            stage: {
+                "limit": limit,
+                "active": self._active[stage].value,
+                "waiting": self._waiting[stage].value,
+            }
+            for stage, limit in self.limits.items()
+        }
+
+
+class StageTicket:
+    def __init__(self, gate):
+        self.gate = gate
+        self.stage = None
+
+    def enter(self, stage):
+        """Moves the job to stage: frees the current slot first, then waits for one in stage"""
+        if stage == self.stage:
+            return
+        self.leave()
+        gate = self.gate
+        self._mark(stage, waiting=1)
+        gate._add(gate._waiting[stage], 1)
+        try:
+            gate._slots[stage].acquire()
+        except BaseException:
+            gate._add(gate._waiting[stage], -1)
+            self._mark(stage, waiting=-1)
+            raise
+        gate._add(gate._waiting[stage], -1)
+        gate._add(gate._active[stage], 1)
+        self._mark(stage, waiting=-1, active=1)
+        self.stage = stage
+
+    def leave(self):
+        if self.stage is None:
+            return
+        stage, self.stage = self.stage, None
+        self._mark(stage, active=-1)
+        self.gate._add(self.gate._active[stage], -1)
+        self.gate._slots[stage].release()
+
+    def _mark(self, stage, active=0, waiting=0):
+        held = self.gate.held
+        if held is None:
+            return
+        i = list(self.gate.limits).index(stage)
+        with held.get_lock():
+            held[i] += active
+            held[len(self.gate.limits) + i] += waiting
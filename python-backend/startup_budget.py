@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Startup-time regression check.
+
+Measures `python -X importtime -c "import <module>"` for the backend entry modules
+and fails (exit 1) when one goes over its budget or eagerly imports a module that
+must stay lazy. Each module is measured several times and the fastest run counts,
+to keep noise from other processes out of the result.
+
+    python startup_budget.py                 # default budgets
+    python startup_budget.py --budget app=600 --runs 5 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Cumulative import time budgets in milliseconds
+BUDGETS_MS = {
+    'yt': 60,
+    'app': 600,
+}
+# Heavy modules that must only be imported on first use
+MUST_STAY_LAZY = {
+    'yt': ['yt_dlp'],
+    'app': ['yt_dlp'],
+}
+
+
+def measure(module):
+    """One fresh interpreter importing module. Returns (total_ms, {imported module: (self_ms, cumulative_ms)})."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    imports = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return imports[module][1], imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help='override a budget, e.g. app=600 (repeatable)')
+    parser.add_argument('--runs', type=int, default=3, help='runs per module; the fastest counts')
+    parser.add_argument('--top', type=int, default=10, help='show the N slowest imports (self time)')
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS_MS)
+    for item in args.budget:
+        module, _, ms = item.partition('=')
+        budgets[module] = float(ms)
+
+    failed = False
+    for module, budget in budgets.items():
+        total, imports = min((measure(module) for _ in range(max(1, args.runs))), key=lambda r: r[0])
+        status = 'ok' if total <= budget else 'OVER BUDGET'
+        print(f"{module}: {total:.1f} ms (budget {budget:.0f} ms) {status}")
+        if total > budget:
+            failed = True
+        for lazy in MUST_STAY_LAZY.get(module, []):
+            if lazy in imports:
+                print(f"  {lazy} is imported eagerly (cumulative {imports[lazy][1]:.1f} ms) — it must stay lazy")
+                failed = True
+        slowest = sorted(imports.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]
+        for name, (self_ms, cumulative_ms) in slowest:
+            print(f"  {self_ms:8.1f} ms self {cumulative_ms:9.1f} ms cumulative  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
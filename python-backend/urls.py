@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Strict YouTube URL canonicalization: no network, no yt-dlp, one precompiled regex per URL shape.
+
+Every form of the same video (watch?v=, youtu.be/, /shorts/, /embed/, /live/, m./music./nocookie
+hosts, extra params like si= or list=) maps to one 11-character ID, which is what the caches and
+coalescing keys use."""
+import re
+
+_VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+_VIDEO_URL = re.compile(r'''
+    (?i:https?://)?
+    (?i:(?:www\.|m\.|music\.)?)
+    (?:
+        (?i:youtu\.be)/(?P<short>[A-Za-z0-9_-]{11})
+      | (?i:youtube(?:-nocookie)?\.com)/
+        (?:
+            (?:shorts|embed|live|v|e)/(?P<path>[A-Za-z0-9_-]{11})
+          | watch/?\?(?:[^#]*&)?v=(?P<query>[A-Za-z0-9_-]{11})
+        )
+    )
+    (?:[/?&#]\S*)?
+''', re.VERBOSE)
+_PLAYLIST_URL = re.compile(r'''
+    (?i:https?://)?
+    (?i:(?:www\.|m\.|music\.)?youtube\.com)/
+    (?:playlist|watch)/?\?(?:[^#]*&)?list=(?P<list>[A-Za-z0-9_-]{10,64})
+    (?:[&#]\S*)?
+''', re.VERBOSE)
+
+
+def video_id(url):
+    """The 11-character video ID of a YouTube video URL (or of a bare ID), or None"""
+    if not isinstance(url, str) or len(url) > 2048:
+        return None
+    url = url.strip()
+    if _VIDEO_ID.fullmatch(url):
+        return url
+    match = _VIDEO_URL.fullmatch(url)
+    if not match:
+        return None
+    return match.group('short') or match.group('path') or match.group('query')
+
+
+def canonical_url(url):
+    """https://www.youtube.com/watch?v=<id> for any recognized video URL, or None"""
+    vid = video_id(url)
+    return f"https://www.youtube.com/watch?v={vid}" if vid else None
+
+
+def playlist_id(url):
+    """The playlist ID of a YouTube playlist URL (playlist?list= or watch?...&list=), or None"""
+    if not isinstance(url, str) or len(url) > 2048:
+        return None
+    match = _PLAYLIST_URL.fullmatch(url.strip())
+    return match.group('list') if match else None
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import itertools
+import multiprocessing
+import queue
+import sys
+import threading
+import traceback
+
+
+class WorkerCrashed(RuntimeError):
+    """A worker process died while running a call"""
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process in MiB (0 where the resource module is unavailable, e.g. Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+def _worker_main(conn, max_jobs, max_rss_mb, stages=None, held=None):
+    """Worker process loop: holds one warm YouTubeDownloader and runs the calls sent over conn, each
+    in its own thread, so a job waiting on the network doesn't keep the process from taking others.
+    Replies carry the call ID they answer. None from the parent means: finish running calls, exit."""
+    from yt import YouTubeDownloader
+    downloader = YouTubeDownloader()
+    if stages is not None:
+        downloader.stages = stages  # download / FFmpeg limits shared with the other workers
+        stages.held = held  # lets the parent free our slots if this process dies mid-job
+    downloader.preload()  # idle until the first call anyway, so warm up before it arrives
+    send_lock = threading.Lock()  # calls and yt-dlp's fragment threads all send over one pipe
+    jobs_lock = threading.Lock()
+    jobs = [0]
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    def run(call_id, method, args, kwargs, wants_progress):
+        if wants_progress:
+            kwargs['progress'] = lambda event: send(('event', call_id, event))
+        try:
+            reply = ('ok', getattr(downloader, method)(*args, **kwargs))
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            reply = ('error', f"{type(e).__name__}: {e}")
+        with jobs_lock:
+            jobs[0] += 1
+            # Ask to be recycled after N jobs or once memory has grown past the ceiling
+            recycle = jobs[0] >= max_jobs or bool(max_rss_mb and _peak_rss_mb() > max_rss_mb)
+        try:
+            # Cache counters ride along with every result, so the parent can report them for all workers
+            send(('result', call_id, reply, recycle, downloader.cache_counters()))
+        except (OSError, ValueError):
+            pass  # parent went away
+
+    threads = []
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            if msg is None:
+                break
+            thread = threading.Thread(target=run, args=msg, name=f"call-{msg[0]}", daemon=True)
+            thread.start()
+            threads = [t for t in threads if t.is_alive()] + [thread]
+        for thread in threads:
+            thread.join()
+    finally:
+        downloader.ydl_pool.close()  # also saves the cookie jar
+
+
+class _Worker:
+    def __init__(self, process, conn, held=None):
+        self.process = process
+        self.conn = conn
+        self.held = held  # StageGate.holder() of this worker
+        self.calls = {}  # call ID -> queue.Queue of replies for the waiting caller
+        self.send_lock = threading.Lock()
+        self.draining = False  # asked to recycle (or pool closing): no new calls, exit once idle
+        self.stopping = False  # sent None; EOF from here on is a normal exit
+
+
+class ProcessWorkerPool:
+    """Pool of long-lived worker processes running YouTubeDownloader methods, so extraction and
+    post-processing scale across cores instead of sharing one interpreter's GIL.
+
+    Each process runs up to concurrency calls at once (one thread per call); the StageGate, not the
+    process count, decides how many of them download or run FFmpeg at the same time. A reader thread
+    per worker routes replies to the waiting callers by call ID and replaces the worker when it exits."""
+
+    def __init__(self, size, max_jobs=50, max_rss_mb=1024, stages=None, concurrency=1):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.concurrency = max(1, concurrency)
+        self.stages = stages  # StageGate handed to every worker at spawn (its semaphores can't go over a pipe)
+        # spawn: fork is unsafe in a process that already runs threads (uvicorn, executors)
+        self._ctx = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)  # notified whenever a call slot frees up
+        self._workers = []
+        self._ids = itertools.count(1)
+        self._closing = False
+        self.recycled = 0
+        self.crashed = 0
+        self._cache_counters = {}  # pid -> latest {cache: (hits, misses)} of a live worker
+        self._retired_counters = {}  # cache -> [hits, misses] of workers already retired
+        for _ in range(size):
+            self._spawn()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        held = self.stages.holder() if self.stages is not None else None
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.max_jobs, self.max_rss_mb, self.stages, held),
+            name="yt-worker",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn, held)
+        with self._available:
+            self._workers.append(worker)
+            self._available.notify_all()
+        threading.Thread(target=self._read, args=(worker,), name=f"yt-worker-{process.pid}", daemon=True).start()
+        return worker
+
+    def _stop(self, worker):
+        """Tells an idle worker to exit; called with the lock held"""
+        if worker.stopping:
+            return
+        worker.stopping = True
+        try:
+            with worker.send_lock:
+                worker.conn.send(None)
+        except OSError:
+            pass
+
+    def _read(self, worker):
+        """Reader thread: delivers a worker's replies; on exit (or crash) fails its calls and replaces it"""
+        try:
+            while True:
+                msg = worker.conn.recv()
+                with self._available:
+                    replies = worker.calls.get(msg[1])
+                    if msg[0] == 'result':
+                        _, call_id, reply, recycle, counters = msg
+                        worker.calls.pop(call_id, None)
+                        self._cache_counters[worker.process.pid] = counters
+                        if recycle and not worker.draining:
+                            worker.draining = True
+                            self.recycled += 1
+                        if worker.draining and not worker.calls:
+                            self._stop(worker)
+                        self._available.notify_all()
+                if replies is not None:
+                    replies.put(('result', reply) if msg[0] == 'result' else ('event', msg[2]))
+        except (EOFError, OSError):
+            pass
+        with self._available:
+            self._workers.remove(worker)
+            orphaned = list(worker.calls.values())
+            worker.calls.clear()
+            crashed = not worker.stopping or bool(orphaned)
+            if crashed:
+                self.crashed += 1
+            respawn = not self._closing
+        if crashed:
+            sys.stderr.write(f"[workers] worker {worker.process.pid} died (exit {worker.process.exitcode}) "
+                             f"with {len(orphaned)} call(s) running, respawning\n")
+        self._retire(worker)
+        for replies in orphaned:
+            replies.put(('crashed', worker.process.exitcode))
+        if respawn:
+            self._spawn()
+
+    def _retire(self, worker):
+        with self._lock:
+            for name, (hits, misses) in self._cache_counters.pop(worker.process.pid, {}).items():
+                total = self._retired_counters.setdefault(name, [0, 0])
+                total[0] += hits
+                total[1] += misses
+        worker.conn.close()
+        worker.process.join(timeout=5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        if worker.held is not None:
+            self.stages.release(worker.held)  # a crashed worker never got to leave its stages
+
+    def call(self, method, *args, progress=None, **kwargs):
+        """Runs downloader.<method>(*args, **kwargs) in a worker with a free call slot, blocking until it
+        finishes. Progress events the method emits are relayed to progress(event) in the calling thread."""
+        replies = queue.Queue()
+        with self._available:
+            while True:
+                ready = [w for w in self._workers if not w.draining and not w.stopping and len(w.calls) < self.concurrency]
+                if ready:
+                    break
+                if self._closing:
+                    raise RuntimeError("worker pool is closed")
+                self._available.wait()
+            worker = min(ready, key=lambda w: len(w.calls))  # spread calls over the processes
+            call_id = next(self._ids)
+            worker.calls[call_id] = replies
+        try:
+            try:
+                with worker.send_lock:
+                    worker.conn.send((call_id, method, args, kwargs, progress is not None))
+            except Exception:
+                # e.g. unpicklable arguments — the worker itself is fine (a dead one is replaced by its reader)
+                with self._available:
+                    worker.calls.pop(call_id, None)
+                    self._available.notify_all()
+                raise
+            while True:
+                msg = replies.get()
+                if msg[0] == 'event':
+                    try:
+                        progress(msg[1])
+                    except Exception:
+                        traceback.print_exc(file=sys.stderr)
+                    continue
+                if msg[0] == 'crashed':
+                    raise WorkerCrashed(f"worker crashed during {method} (exit {msg[1]})")
+                status, value = msg[1]
+                break
+        finally:
+            with self._available:
+                if worker.calls.pop(call_id, None) is not None:
+                    if worker.draining and not worker.calls:
+                        self._stop(worker)
+                    self._available.notify_all()
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+
+    def close(self):
+        """Asks workers to exit: idle ones now, busy ones once their running calls finish"""
+        with self._available:
+            self._closing = True
+            workers = list(self._workers)
+            for worker in workers:
+                worker.draining = True
+                if not worker.calls:
+                    self._stop(worker)
+            self._available.notify_all()
+        for worker in workers:
+            if worker.stopping:
+                worker.process.join(timeout=5)
+
+    def cache_counters(self):
+        """{cache: (hits, misses)} summed over all workers, past and present"""
+        with self._lock:
+            totals = {name: list(counts) for name, counts in self._retired_counters.items()}
+            for counters in self._cache_counters.values():
+                for name, (hits, misses) in counters.items():
+                    total = totals.setdefault(name, [0, 0])
+                    total[0] += hits
+                    total[1] += misses
+        return {name: tuple(counts) for name, counts in totals.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "concurrency": self.concurrency,
+                "calls": sum(len(w.calls) for w in self._workers),
+                "busy": sum(1 for w in self._workers if w.calls),
+                "idle": sum(1 for w in self._workers if not w.calls),
+                "recycled": self.recycled,
+                "crashed": self.crashed,
+            }
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import contextlib
+import hashlib
+import os
+import sys
+import threading
+import time
+
+
+class YoutubeDLPool:
+    """Warm, pre-configured YoutubeDL instances, one idle list per option profile.
+
+    An instance is checked out by one thread at a time (YoutubeDL is not thread-safe) and put back
+    afterwards, so its keep-alive HTTP connections, parsed cookie jar and the extractor's player JS /
+    signature caches carry over to the next request. Instances are rebuilt after max_age seconds and
+    when the cookies in the cookie file change.
+
+    Cookie changes are detected by content, not mtime: YoutubeDL.close() rewrites the cookie file on
+    every close (pooled and per-job instances alike), which would otherwise retire every idle instance
+    after each conversion."""
+
+    def __init__(self, factory, max_idle=4, max_age=600):
+        self.factory = factory  # factory(opts) -> YoutubeDL
+        self.max_idle = max_idle  # idle instances kept per profile; extras are closed
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._idle = {}  # profile -> [(ydl, created_at, cookie_digest)]
+        self._cookie_stat = None  # (path, mtime, size, digest) of the last cookie file read
+        self.created = 0
+        self.reused = 0
+        self.retired = 0
+
+    def _cookie_digest(self, opts):
+        """Digest of the cookies in opts['cookiefile'], ignoring comments and line order (yt-dlp's saves
+        rewrite the header and may reorder); re-read only when the file's mtime or size changes"""
+        path = opts.get('cookiefile')
+        if not path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        cached = self._cookie_stat
+        if cached and cached[:3] == (path, st.st_mtime, st.st_size):
+            return cached[3]
+        try:
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        # '#HttpOnly_' lines are cookies (yt-dlp saves them without the prefix), other '#' lines are comments
+        cookies = sorted(line.strip().removeprefix(b'#HttpOnly_') for line in lines
+                         if line.strip() and (not line.startswith(b'#') or line.startswith(b'#HttpOnly_')))
+        digest = hashlib.sha1(b'\n'.join(cookies)).hexdigest()
+        self._cookie_stat = (path, st.st_mtime, st.st_size, digest)
+        return digest
+
+    def _close(self, ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            sys.stderr.write(f"[ydl-pool] close failed: {e}\n")
+
+    @contextlib.contextmanager
+    def acquire(self, profile, opts):
+        """Checks out an instance for profile; opts must be the same every time a profile is used"""
+        cookie_digest = self._cookie_digest(opts)
+        entry = None
+        stale = []
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            while idle:
+                candidate = idle.pop()
+                if time.monotonic() - candidate[1] < self.max_age and candidate[2] == cookie_digest:
+                    entry = candidate
+                    self.reused += 1
+                    break
+                stale.append(candidate[0])
+                self.retired += 1
+        for ydl in stale:
+            self._close(ydl)
+        if entry is None:
+            entry = (self.factory(opts), time.monotonic(), cookie_digest)
+            with self._lock:
+                self.created += 1
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                idle = self._idle.setdefault(profile, [])
+                keep = len(idle) < self.max_idle
+                if keep:
+                    idle.append(entry)
+                else:
+                    self.retired += 1
+            if not keep:
+                self._close(entry[0])
+
+    def close(self):
+        with self._lock:
+            entries = [e for idle in self._idle.values() for e in idle]
+            self._idle.clear()
+        for ydl, _, _ in entries:
+            self._close(ydl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "idle": {profile: len(idle) for profile, idle in self._idle.items()},
+                "created": self.created,
+                "reused": self.reused,
+                "retired": self.retired,
+            }
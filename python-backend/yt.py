@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import yt_dlp
 import os
 import sys
 import subprocess
@@ -10,16 +9,123 @@ import uuid
 import shutil
 import unicodedata
 import re
-import urllib.request
-import urllib.error
-import glob
+import tempfile
+import threading
 import time
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import MetadataCache, ResultCache
+from ydlpool import YoutubeDLPool
+from stages import StageGate
+from formats import STANDARD_RESOLUTIONS, codec_family, format_index
+import playercache
+import urls
+
+DOWNLOADS_DIR = os.path.join(os.path.dirname(__file__), "downloads")
+# yt-dlp cachedir shared by all workers: player JS and signature solutions, keyed by player version
+YTDLP_CACHE_DIR = os.environ.get('YTDLP_CACHE_DIR', os.path.join(DOWNLOADS_DIR, "ytdlp-cache"))
+YTDLP_CACHE_KEEP_PLAYERS = int(os.environ.get('YTDLP_CACHE_KEEP_PLAYERS', 3))
+# yt-dlp postprocessors (pp_key names) that run FFmpeg; MoveFiles and the like only touch the filesystem
+FFMPEG_POSTPROCESSORS = frozenset({
+    'Merger', 'ExtractAudio', 'VideoConvertor', 'VideoRemuxer', 'CopyStream', 'Concat', 'Metadata',
+    'EmbedSubtitle', 'EmbedThumbnail', 'ThumbnailsConvertor', 'SubtitlesConvertor', 'ModifyChapters',
+    'SplitChapters', 'FixupM4a', 'FixupM3u8', 'FixupStretched', 'FixupTimestamp', 'FixupDuration',
+    'FixupDuplicateMoov',
+})
+
+def load_yt_dlp():
+    """Imports yt_dlp on first use — it is most of this module's import time (~200 ms)"""
+    import yt_dlp
+    playercache.install()
+    return yt_dlp
+
+_pillow = None
+
+def load_pillow():
+    """PIL.Image when Pillow is installed (optional: poster resizing / WebP / AVIF), else None"""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            _pillow = False
+        else:
+            try:
+                import pillow_avif  # noqa: F401  AVIF plugin for Pillow versions without built-in support
+            except ImportError:
+                pass
+            Image.init()
+            _pillow = Image
+    return _pillow or None
+
+def preload_yt_dlp():
+    """Imports yt_dlp and the YouTube extractor so the first request doesn't pay for them.
+    Meant to run in a background thread once the process is ready to serve."""
+    started = time.monotonic()
+    load_yt_dlp()
+    from yt_dlp.extractor.youtube import YoutubeIE  # noqa: F401
+    sys.stderr.write(f"[startup] yt_dlp imported in {time.monotonic() - started:.2f}s\n")
 
 class YouTubeDownloader:
+    # yt-dlp postprocessor keys -> progress phase reported to clients
+    POSTPROCESSOR_PHASES = {
+        'Merger': 'merge',
+        'ExtractAudio': 'transcode',
+        'MoveFiles': 'move',
+    }
+
     def __init__(self):
         self.ffmpeg_dir = self.check_ffmpeg()
-        self.standard_resolutions = [144, 240, 360, 480, 720, 1080, 1440, 2160]  # Ստանդարտ ռեզոլյուցիաներ
+        self.standard_resolutions = list(STANDARD_RESOLUTIONS)  # Ստանդարտ ռեզոլյուցիաներ
         self.downloads_dir = self.init_downloads_dir()
+        self.info_cache = MetadataCache(
+            max_entries=int(os.environ.get('INFO_CACHE_MAX_ENTRIES', 512)),
+            ttl=float(os.environ.get('INFO_CACHE_TTL', 1800)),  # Keep well under YouTube's ~6h format URL expiry
+            negative_ttl=float(os.environ.get('INFO_CACHE_NEGATIVE_TTL', 60)),
+        )
+        # Preview-card metadata (title, author, thumbnail) has no expiring URLs, so it can live much longer
+        self.preview_cache = MetadataCache(
+            max_entries=int(os.environ.get('PREVIEW_CACHE_MAX_ENTRIES', 4096)),
+            ttl=float(os.environ.get('PREVIEW_CACHE_TTL', 6 * 3600)),
+            negative_ttl=float(os.environ.get('INFO_CACHE_NEGATIVE_TTL', 60)),
+        )
+        self.result_cache = ResultCache(
+            os.environ.get('RESULT_CACHE_DIR', self.downloads_dir['cache']),
+            max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 5 * 1024 ** 3)),
+        )
+        self.poster_cache = ResultCache(
+            os.environ.get('POSTER_CACHE_DIR', os.path.join(self.downloads_dir['cache'], 'posters')),
+            max_bytes=int(os.environ.get('POSTER_CACHE_MAX_BYTES', 256 * 1024 ** 2)),
+        )
+        self._http = None  # see http()
+        self._http_executor = None
+        self._http_lock = threading.Lock()
+        # Download / post-process slots; the app replaces this with one gate shared by all worker processes
+        self.stages = StageGate()
+        # Warm YoutubeDL instances for extraction (info / playlist / stream); downloads build their own,
+        # since their output template, hooks and postprocessors are fixed at construction
+        self.ydl_pool = YoutubeDLPool(
+            lambda opts: load_yt_dlp().YoutubeDL(opts),
+            max_idle=int(os.environ.get('YDL_POOL_MAX_IDLE', 4)),
+            max_age=float(os.environ.get('YDL_POOL_MAX_AGE', 600)),
+        )
+
+    def cache_counters(self):
+        """{cache: (hits, misses)} of this process's caches"""
+        caches = {'info': self.info_cache, 'previews': self.preview_cache,
+                  'results': self.result_cache, 'posters': self.poster_cache}
+        return {name: (cache.hits, cache.misses) for name, cache in caches.items()}
+
+    def preload(self):
+        """Imports yt_dlp, rotates old player versions out of the disk cache and seeds the info profile of ydl_pool"""
+        try:
+            preload_yt_dlp()
+            playercache.prune(YTDLP_CACHE_DIR, YTDLP_CACHE_KEEP_PLAYERS)
+            with self.ydl_pool.acquire('info', self._info_opts()) as ydl:
+                ydl.get_info_extractor('Youtube')
+        except Exception:
+            # Best effort: the first request simply pays for it instead
+            traceback.print_exc(file=sys.stderr)
         
     def check_ffmpeg(self):
         """Ստուգում է FFmpeg-ի առկայությունը"""
@@ -33,9 +139,10 @@ class YouTubeDownloader:
 
     def init_downloads_dir(self):
         """Ստեղծում է downloads թղթապանակի կառուցվածքը"""
-        downloads_dir = os.path.join(os.path.dirname(__file__), "downloads")
+        downloads_dir = DOWNLOADS_DIR
         temp_dir = os.path.join(downloads_dir, "temp")
         final_dir = os.path.join(downloads_dir, "final")
+        cache_dir = os.path.join(downloads_dir, "cache")
         
         os.makedirs(temp_dir, exist_ok=True)
         os.makedirs(final_dir, exist_ok=True)
@@ -43,11 +150,15 @@ class YouTubeDownloader:
         return {
             'base': downloads_dir,
             'temp': temp_dir,
-            'final': final_dir
+            'final': final_dir,
+            'cache': cache_dir
         }
 
     def clean_url(self, url):
-        """Մաքրում է URL-ը պլեյլիստի պարամետրերից"""
+        """Մաքրում է URL-ը պլեյլիստի պարամետրերից — canonical watch URL for any recognized video URL"""
+        canonical = urls.canonical_url(url)
+        if canonical:
+            return canonical
         if '&list=' in url:
             url = url.split('&list=')[0]
         if '?list=' in url:
@@ -82,16 +193,54 @@ class YouTubeDownloader:
         # YouTube: use web client so cookies are applied; default fallback
         base['extractor_args'] = {'youtube': {'player_client': ['web', 'default']}}
         # JS runtime for signature solving (Node 20+); yt-dlp finds node in PATH
+        # (API form of --js-runtimes node:PATH — the embedded API rejects the CLI string form)
         node_path = shutil.which('node')
-        if node_path:
-            base['js_runtimes'] = f'node:{node_path}'
-        else:
-            base['js_runtimes'] = 'node'
+        base['js_runtimes'] = {'node': {'path': node_path}}
+        # Solved signatures and player JS survive restarts and are shared between worker processes
+        base['cachedir'] = YTDLP_CACHE_DIR
         return base
 
-    def get_video_info(self, url):
-        """Ստանում է տեսանյութի մասին տեղեկություն"""
-        ydl_opts = {
+    def _progress_opts(self, progress, ticket=None):
+        """yt-dlp hook options that forward download/post-processing progress to progress(event) and,
+        with a StageTicket, move the job to the 'postprocess' stage when the first FFmpeg postprocessor starts"""
+        hooks = {'progress_hooks': [], 'postprocessor_hooks': []}
+        if ticket:
+            def on_stage(d):
+                if d['status'] == 'started' and d.get('postprocessor') in FFMPEG_POSTPROCESSORS:
+                    ticket.enter('postprocess')
+            hooks['postprocessor_hooks'].append(on_stage)
+        if not progress:
+            return {key: value for key, value in hooks.items() if value}
+        last_sent = [0.0]
+
+        def on_download(d):
+            if d['status'] == 'downloading':
+                # yt-dlp calls this for every chunk — throttle to a few events per second
+                now = time.monotonic()
+                if now - last_sent[0] < 0.5:
+                    return
+                last_sent[0] = now
+            progress({
+                'phase': 'download',
+                'status': d['status'],
+                'downloaded_bytes': d.get('downloaded_bytes'),
+                'total_bytes': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                'speed': d.get('speed'),
+                'eta': d.get('eta'),
+            })
+
+        def on_postprocess(d):
+            progress({
+                'phase': self.POSTPROCESSOR_PHASES.get(d.get('postprocessor'), 'postprocess'),
+                'status': d['status'],
+            })
+
+        hooks['progress_hooks'].append(on_download)
+        hooks['postprocessor_hooks'].append(on_postprocess)
+        return hooks
+
+    def _info_opts(self):
+        return {
             **self._get_base_ydl_opts(),
             'quiet': True, 
             'no_warnings': True, 
@@ -105,38 +254,143 @@ class YouTubeDownloader:
             'retries': 3,
             'http_chunk_size': 10485760,  # 10MB chunks for faster processing
         }
+
+    def get_video_info(self, url):
+        """Ստանում է տեսանյութի մասին տեղեկություն"""
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self.ydl_pool.acquire('info', self._info_opts()) as ydl:
                 return ydl.extract_info(url, download=False)
         except Exception as e:
             traceback.print_exc(file=sys.stderr)
             return None
     
-    def get_video_info_json(self, url):
-        """Ստանում է տեսանյութի տեղեկություն JSON ձևաչափով (API-ի համար)"""
+    def video_id_from_url(self, url):
+        """Returns the YouTube video ID for a URL without any network access, or None"""
+        return urls.video_id(url)
+
+    def video_cache_key(self, url):
+        """Cache key for a URL: canonical video ID when recognizable, else the cleaned URL"""
+        return self.video_id_from_url(url) or self.clean_url(url)
+
+    def get_cached_video_info(self, url):
+        """Like get_video_info, but served from info_cache when possible. Returns (info, cache_hit)."""
+        key = self.video_cache_key(url)
+        found, info = self.info_cache.get(key)
+        if found:
+            return info, True
         info = self.get_video_info(url)
-        if not info:
-            return json.dumps({"success": False, "error": "Failed to get video info"}, ensure_ascii=False)
-        
-        resolutions = self.get_available_standard_resolutions(info)
-        
-        # Extract clean title and thumbnail
-        title = info.get('title', 'Unknown')
-        thumbnail = info.get('thumbnail', '')
-        duration = info.get('duration', 0)
-        uploader = info.get('uploader', 'Unknown')
-        
-        result = {
-            "success": True,
-            "title": title,
+        if info:
+            format_index(info)  # built once here, read by listing, selection and size estimation
+        self.info_cache.set(key, info)
+        return info, False
+
+    def peek_cached_video_info(self, url):
+        """Cached info for url without extracting on a miss; sanitized so it can be sent to a worker process"""
+        found, info = self.info_cache.get(self.video_cache_key(url))
+        if not found or not info:
+            return None
+        return load_yt_dlp().YoutubeDL.sanitize_info(info, remove_private_keys=True)
+
+    def _download_with_info(self, ydl, info):
+        """Runs the download/post-processing stage on an already-extracted info dict (no second extraction)"""
+        # Same path yt-dlp uses for --load-info-json: reselect formats from the cached info and download
+        info = ydl.sanitize_info(info, remove_private_keys=True)
+        try:
+            return ydl.process_ie_result(info, download=True)
+        except (load_yt_dlp().utils.DownloadError, load_yt_dlp().utils.ReExtractInfo):
+            # Format URLs expired or were rejected — fall back to a fresh extraction
+            webpage_url = info.get('webpage_url')
+            if not webpage_url:
+                raise
+            sys.stderr.write(f"Stale info for {webpage_url}, re-extracting\n")
+            return ydl.extract_info(webpage_url, download=True)
+
+    def video_summary(self, info):
+        """The /info card for an extracted info dict"""
+        index = format_index(info)
+        resolutions = index.resolutions
+        thumbnail = info.get('thumbnail') or ((info.get('thumbnails') or [{}])[-1].get('url') or '')
+        return {
+            "title": info.get('title', 'Unknown'),
             "thumbnail": thumbnail,
-            "duration": duration,
-            "author": uploader,
+            "duration": info.get('duration', 0),
+            "author": info.get('uploader', 'Unknown'),
             "resolutions": resolutions if resolutions else [360, 480, 720],
+            "sizes": {str(res): size for res, size in index.sizes().items()},  # estimated bytes per resolution
             "video_id": info.get('id', ''),
-            "description": info.get('description', '')[:200] if info.get('description') else ''
+            "description": info.get('description', '')[:200] if info.get('description') else '',
         }
-        
+
+    def _preview_opts(self):
+        """Light extraction for previews: no player JS / signature solving, no DASH/HLS manifests"""
+        base = self._get_base_ydl_opts()
+        base['extractor_args'] = {'youtube': {'player_client': ['web'], 'player_skip': ['js'], 'skip': ['dash', 'hls']}}
+        return {
+            **base,
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'socket_timeout': 10,
+            'retries': 1,
+        }
+
+    def get_video_preview(self, url):
+        """Preview card without full format resolution. Returns (card or None, complete, cache_hit):
+        the full card when a full extraction is already cached, else oEmbed metadata (duration and
+        resolutions unknown), else a light extraction (process=False, no signature solving)."""
+        key = self.video_cache_key(url)
+        found, info = self.info_cache.get(key)
+        if found and info:
+            return self.video_summary(info), True, True
+        found, card = self.preview_cache.get(key)
+        if found:
+            return card, False, True
+
+        card = None
+        oembed = self.oembed(self.clean_url(url))
+        if oembed:
+            video_id = self.video_id_from_url(url) or ''
+            card = {
+                "title": oembed.get('title', 'Unknown'),
+                "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg" if video_id else oembed.get('thumbnail_url', ''),
+                "duration": None,
+                "author": oembed.get('author_name', 'Unknown'),
+                "resolutions": [360, 480, 720],
+                "sizes": {},
+                "video_id": video_id,
+                "description": '',
+            }
+        else:
+            try:
+                with self.ydl_pool.acquire('preview', self._preview_opts()) as ydl:
+                    info = ydl.extract_info(url, download=False, process=False)
+                if info:
+                    card = self.video_summary(info)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+        self.preview_cache.set(key, card)
+        return card, False, False
+
+    def get_video_info_json(self, url, mode='full'):
+        """Ստանում է տեսանյութի տեղեկություն JSON ձևաչափով (API-ի համար).
+        mode='preview' answers from get_video_preview; 'complete' tells the client whether a full
+        extraction backed the answer (otherwise ask again with mode='full' to upgrade)."""
+        if mode == 'preview':
+            card, complete, cache_hit = self.get_video_preview(url)
+        else:
+            info, cache_hit = self.get_cached_video_info(url)
+            card, complete = (self.video_summary(info) if info else None), True
+        if not card:
+            return json.dumps({"success": False, "error": "Failed to get video info", "cache_hit": cache_hit}, ensure_ascii=False)
+
+        result = {
+            "success": True,
+            **card,
+            "mode": mode,
+            "complete": complete,
+            "cache_hit": cache_hit
+        }
+
         return json.dumps(result, ensure_ascii=False)
 
     def get_playlist_info(self, url):
@@ -152,28 +406,29 @@ class YouTubeDownloader:
             'retries': 3,
         }
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self.ydl_pool.acquire('playlist', ydl_opts) as ydl:
                 return ydl.extract_info(url, download=False)
         except Exception as e:
             print(f"❌ Սխալ պլեյլիստի տեղեկություն ստանալիս: {e}")
             return None
 
-    def find_downloaded_file(self, url, output_path, expected_ext):
-        """Գտնում է բեռնված ֆայլը. If no exact title match, falls back to newest file with expected_ext in temp_dir."""
-        try:
-            if not os.path.exists(output_path):
-                return None
-            
-            files = [f for f in os.listdir(output_path) if f.endswith(expected_ext)]
-            print(f"Searching in {output_path} for .{expected_ext}, found: {files}")
-            if files:
-                latest_file = max([os.path.join(output_path, f) for f in files], key=os.path.getctime)
-                return latest_file
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-        
-        return None
+    def make_job_dir(self, temp_dir):
+        """Private temp directory for one conversion, so concurrent jobs never see each other's files"""
+        os.makedirs(temp_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix='job-', dir=temp_dir)
+
+    def downloaded_filepath(self, result_info):
+        """Output path yt-dlp reports for a processed download (after merge/post-processing), or None"""
+        if not result_info:
+            return None
+        downloads = result_info.get('requested_downloads') or [result_info]
+        file_path = downloads[-1].get('filepath') or downloads[-1].get('_filename')
+        return file_path if file_path and os.path.isfile(file_path) else None
+
+    def final_dir_for(self, output_path='.'):
+        """Absolute final folder for an output_path (same layout move_to_final_folder uses)"""
+        base = os.path.abspath(output_path) if output_path != '.' else os.path.abspath(self.downloads_dir['base'])
+        return os.path.abspath(os.path.join(base, 'final'))
 
     def move_to_final_folder(self, original_path, original_filename=None, output_path='.', force_mp3=False):
         """Տեղափոխում է ֆայլը final թղթապանակ՝ պահպանելով բնօրիգինալ անունը"""
@@ -191,9 +446,8 @@ class YouTubeDownloader:
                 original_filename = os.path.basename(original_path)
             
             # Resolve final_dir and temp_dir with absolute paths
-            base = os.path.abspath(output_path) if output_path != '.' else os.path.abspath(self.downloads_dir['base'])
-            final_dir = os.path.abspath(os.path.join(base, 'final'))
-            temp_dir = os.path.abspath(os.path.join(base, 'temp'))
+            final_dir = self.final_dir_for(output_path)
+            temp_dir = os.path.abspath(os.path.join(os.path.dirname(final_dir), 'temp'))
             
             os.makedirs(final_dir, exist_ok=True)
             os.makedirs(temp_dir, exist_ok=True)
@@ -202,12 +456,21 @@ class YouTubeDownloader:
                 final_name = self.sanitize_filename(os.path.splitext(original_filename)[0]) + ".mp3"
             else:
                 final_name = original_filename
-            final_path = os.path.join(final_dir, final_name)
-            print(f"Attempting move from {original_path} to {final_path}")
             if not os.path.exists(original_path):
                 print("Source file missing before move")
                 return None, original_filename or os.path.basename(original_path)
-            shutil.move(original_path, final_path)
+            # /jobs and /playlist conversions don't go through the /download single-flight, so two runs can
+            # finish the same title at once; each gets its own file (the caller deletes it after serving)
+            final_path = self.reserve_final_path(os.path.join(final_dir, final_name))
+            print(f"Attempting move from {original_path} to {final_path}")
+            try:
+                shutil.move(original_path, final_path)  # replaces the empty placeholder
+            except Exception:
+                try:
+                    os.remove(final_path)
+                except OSError:
+                    pass
+                raise
             print(f"Final path resolved: {final_path}")
             if force_mp3:
                 print(f"Final MP3 path: {final_path}")
@@ -217,14 +480,121 @@ class YouTubeDownloader:
             sys.stderr.write(traceback.format_exc())
             return None, original_filename or os.path.basename(original_path)
 
-    def download_mp3(self, url, output_path='.', quality_kbps='320'):
-        """MP3 download — temporary simplified: always 320kbps."""
-        kbps_int = 320
-        print(f"Using kbps: {kbps_int} (CBR, fixed)")
+    def _link_or_copy(self, src, dst):
+        """Hardlinks src to dst (instant, no extra disk), copying when linking is not possible"""
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    @staticmethod
+    def reserve_final_path(path):
+        """Atomically claims path, or path with a random suffix when it is taken, by creating it empty"""
+        stem, ext = os.path.splitext(path)
+        while True:
+            try:
+                with open(path, 'x'):
+                    return path
+            except FileExistsError:
+                path = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+
+    def share_final_file(self, file_path):
+        """Gives another requester its own name for an already-finished file (hardlink, copy as fallback).
+        The Node side deletes a file after serving it, so coalesced requests must not share one path."""
+        stem, ext = os.path.splitext(file_path)
+        shared_path = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+        self._link_or_copy(file_path, shared_path)
+        return shared_path
+
+    def get_cached_result(self, url, profile, output_path='.', cache=None):
+        """Serves a previously converted file from result_cache (or the given cache) into the final folder.
+        Returns (final_path, title) or None."""
+        video_id = self.video_id_from_url(url)
+        if not video_id:
+            return None
+        cached = (cache or self.result_cache).get(video_id, profile)
+        if not cached:
+            return None
+        data_path, meta = cached
+        final_dir = self.final_dir_for(output_path)
+        os.makedirs(final_dir, exist_ok=True)
+        final_path = os.path.join(final_dir, meta['filename'])
+        if os.path.exists(final_path):
+            stem, ext = os.path.splitext(final_path)
+            final_path = f"{stem}_{uuid.uuid4().hex[:8]}{ext}"
+        try:
+            self._link_or_copy(data_path, final_path)
+        except OSError:
+            # Evicted between lookup and link — treat as a miss
+            return None
+        print(f"Result cache hit: {video_id}.{profile} -> {final_path}")
+        return final_path, meta['title']
+
+    def store_result(self, video_info, profile, final_path, title):
+        """Adds a finished conversion to result_cache"""
+        video_id = video_info.get('id')
+        if video_id and final_path:
+            self.result_cache.put(video_id, profile, final_path, {
+                'title': title,
+                'filename': os.path.basename(final_path),
+            })
+
+    # Audio output profiles. Passthrough profiles copy the source stream into a proper container
+    # (FFmpegExtractAudio stream-copies when the source codec already matches); only MP3 is encoded.
+    # quality -> (format selector, preferred codec, source codec family that allows a copy)
+    AUDIO_PROFILES = {
+        'm4a': ('bestaudio[acodec^=mp4a]/bestaudio/best', 'm4a', 'mp4a'),  # AAC in .m4a
+        'opus': ('bestaudio[acodec=opus]/bestaudio/best', 'opus', 'opus'),  # Opus in .opus (Ogg)
+        'audio': ('bestaudio/best', 'best', None),  # whatever the best source is, in its native container
+    }
+
+    @staticmethod
+    def is_audio_quality(quality):
+        quality = str(quality)
+        return quality == 'mp3' or quality.startswith('mp3-') or quality in YouTubeDownloader.AUDIO_PROFILES
+
+    def audio_profile(self, quality, info=None):
+        """(cache profile, format selector, postprocessor codec, kbps or None, passthrough) for an audio quality.
+        MP3 is temporary simplified: always 320kbps CBR. With info, passthrough is checked against the format index."""
+        quality = str(quality)
+        if quality in self.AUDIO_PROFILES:
+            format_str, codec, source_codec = self.AUDIO_PROFILES[quality]
+            passthrough = True
+            if info and source_codec:
+                passthrough = format_index(info).best_audio(acodec=source_codec) is not None
+            return quality, format_str, codec, None, passthrough
+        return 'mp3-320', 'bestaudio/best', 'mp3', 320, False
+
+    def download_mp3(self, url, output_path='.', quality_kbps='320', info=None, progress=None):
+        """MP3 download — temporary simplified: always 320kbps. Pass `info` to reuse an existing extraction,
+        `progress` to receive phase/byte progress events."""
+        return self.download_audio(url, 'mp3', output_path, info=info, progress=progress)
+
+    def download_audio(self, url, quality='mp3', output_path='.', info=None, progress=None):
+        """Audio download for any AUDIO_PROFILES quality or mp3/mp3-<kbps>. Passthrough profiles only remux
+        (no decode/encode); MP3 is transcoded."""
+        profile, format_str, codec, kbps_int, _ = self.audio_profile(quality)
+        is_mp3 = codec == 'mp3'
+        if is_mp3:
+            print(f"Using kbps: {kbps_int} (CBR, fixed)")
+        cached = self.get_cached_result(url, profile, output_path)
+        if cached:
+            return cached
         # Ստանալ վիդեոյի տեղեկություն (բնօրիգինալ անունը)
-        video_info = self.get_video_info(url)
+        if progress and not info:
+            progress({'phase': 'extract', 'status': 'started'})
+        video_info = info or self.get_cached_video_info(url)[0]
         if not video_info:
             return None
+        has_ffmpeg = bool(self.ffmpeg_binary())
+        if not is_mp3:
+            # FFmpegExtractAudio copies the stream only when the source codec matches; say which will happen
+            if not has_ffmpeg:
+                print(f"Audio profile: {profile} (no FFmpeg, keeping the source file as is)")
+            elif self.audio_profile(quality, video_info)[4]:
+                print(f"Audio profile: {profile} (stream copy)")
+            else:
+                print(f"Audio profile: {profile} (no {profile}-compatible stream, transcoding)")
         
         original_title = video_info.get('title', 'video')
         
@@ -239,11 +609,14 @@ class YouTubeDownloader:
             temp_dir = self.downloads_dir['temp']
         
         expected_title = self.sanitize_filename(original_title)
-        # Force output template with sanitized title so we can rename to .mp3 after
+        job_dir = self.make_job_dir(temp_dir)
+        # Force output template with sanitized title so the final name is predictable
+        ticket = self.stages.ticket()  # network slot now, FFmpeg slot once post-processing starts
         ydl_opts = {
             **self._get_base_ydl_opts(),
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(temp_dir, f"{expected_title}.%(ext)s"),
+            **self._progress_opts(progress, ticket),
+            'format': format_str,
+            'outtmpl': os.path.join(job_dir, f"{expected_title}.%(ext)s"),
             'quiet': True,
             'no_warnings': True,
             'noplaylist': True,
@@ -255,82 +628,187 @@ class YouTubeDownloader:
             'concurrent_fragments': 4,  # Download fragments in parallel
         }
         
-        if self.ffmpeg_dir:
-            # preferredquality > 10 → yt-dlp uses -b:a {value}k (CBR)
-            ydl_opts.update({
-                'ffmpeg_location': self.ffmpeg_dir,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': kbps_int,
-                }]
-            })
+        # FFmpeg bundled or on PATH (the Ubuntu deployment uses apt's ffmpeg)
+        if has_ffmpeg:
+            # preferredquality > 10 → yt-dlp uses -b:a {value}k (CBR); ignored when the stream is copied
+            postprocessor = {'key': 'FFmpegExtractAudio', 'preferredcodec': codec}
+            if kbps_int:
+                postprocessor['preferredquality'] = kbps_int
+            ydl_opts['postprocessors'] = [postprocessor]
+            if self.ffmpeg_dir:
+                ydl_opts['ffmpeg_location'] = self.ffmpeg_dir
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-            # Give FFmpeg time to finish writing the .mp3 file.
-            time.sleep(2)
-            temp_dir_abs = os.path.abspath(temp_dir)
-            mp3_path = os.path.join(temp_dir_abs, f"{expected_title}.mp3")
-            # Force rename any .webm/.m4a/.opus to .mp3 if FFmpegExtractAudio didn't rename
-            for ext in ['.webm', '.m4a', '.opus']:
-                candidate = os.path.join(temp_dir_abs, f"{expected_title}{ext}")
-                if os.path.isfile(candidate):
-                    try:
-                        os.rename(candidate, mp3_path)
-                        print(f"Renamed {candidate} to {mp3_path}")
-                    except OSError as e:
-                        sys.stderr.write(f"Rename failed: {e}\n")
-                    break
-            # file_path: prefer .mp3 at expected path, else newest .mp3, else fallbacks
-            if os.path.isfile(mp3_path):
-                file_path = mp3_path
-                print(f"Using MP3 at expected path: {file_path}")
-            else:
-                mp3_files = glob.glob(os.path.join(temp_dir_abs, '*.mp3'))
-                all_files = []
-                if mp3_files:
-                    file_path = max(mp3_files, key=os.path.getctime)
-                    print(f"Found newest MP3 in temp: {file_path} (created {time.ctime(os.path.getctime(file_path))})")
-                else:
-                    print(f"No .mp3 files found in {temp_dir_abs}. Listing all files:")
-                    all_files = os.listdir(temp_dir_abs) if os.path.exists(temp_dir_abs) else []
-                    print(all_files)
-                    file_path = None
-                if file_path is None:
-                    candidate = os.path.join(temp_dir_abs, f"{expected_title}.mp3")
-                    if os.path.isfile(candidate):
-                        file_path = candidate
-                        print(f"Found MP3 by title: {file_path}")
-                    if file_path is None:
-                        webm_files = glob.glob(os.path.join(temp_dir_abs, '*.webm'))
-                        if webm_files:
-                            file_path = max(webm_files, key=os.path.getctime)
-                            print(f"Using newest .webm as fallback: {file_path}")
+            ticket.enter('download')
+            with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                result_info = self._download_with_info(ydl, video_info)
+            # yt-dlp reports the post-processed (.mp3/.m4a/.opus) path; without FFmpeg it is the original
+            # audio file, which move_to_final_folder(force_mp3=True) still names .mp3 for MP3 requests
+            file_path = self.downloaded_filepath(result_info)
             if file_path:
                 print(f"Downloaded to: {file_path}")
+                if progress:
+                    progress({'phase': 'move', 'status': 'started'})
                 actual_filename = os.path.basename(file_path)
-                final_path, _ = self.move_to_final_folder(file_path, actual_filename, output_path, force_mp3=True)
+                final_path, _ = self.move_to_final_folder(file_path, actual_filename, output_path, force_mp3=is_mp3)
                 if final_path:
                     print(f"Moved to final: {final_path}")
+                    self.store_result(video_info, profile, final_path, original_title)
                     return final_path, original_title
                 else:
                     sys.stderr.write(f"Error: Failed to move file to final folder\n")
                     return None
             else:
-                sys.stderr.write(f"Error: Could not find downloaded MP3 file in {temp_dir}\n")
-                return {"success": False, "message": "No MP3 file found after conversion"}
+                sys.stderr.write(f"Error: Could not find downloaded {profile} file in {job_dir}\n")
+                return {"success": False, "message": f"No {'MP3' if is_mp3 else 'audio'} file found after conversion"}
         except Exception as e:
             traceback.print_exc(file=sys.stderr)
             return None
+        finally:
+            ticket.leave()
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    MP3_BITRATES = (128, 160, 192, 256, 320)  # mp3-<kbps> variants the fan-out honors
+
+    def fanout_profile(self, quality):
+        """Cache profile of one fan-out output: mp3-<kbps> keeps its bitrate (unknown ones become 320),
+        passthrough qualities map to their AUDIO_PROFILES name"""
+        quality = str(quality)
+        if quality in self.AUDIO_PROFILES:
+            return quality
+        kbps = quality[len('mp3-'):] if quality.startswith('mp3-') else ''
+        return f"mp3-{int(kbps) if kbps.isdigit() and int(kbps) in self.MP3_BITRATES else 320}"
 
-    def download_mp4_with_sound(self, url, resolution, output_path='.'):
-        """MP4 download — temporary simplified: always 1080p (bestvideo[height<=1080]+bestaudio)."""
+    def _fanout_output(self, profile, source_codec):
+        """(FFmpeg output args, extension) for one profile, given the source's codec family"""
+        if profile.startswith('mp3-'):
+            return ['-c:a', 'libmp3lame', '-b:a', f"{profile[len('mp3-'):]}k"], 'mp3'
+        if profile == 'audio':
+            profile = 'opus' if source_codec == 'opus' else 'm4a'
+        if profile == 'opus':
+            return (['-c:a', 'copy'] if source_codec == 'opus' else ['-c:a', 'libopus', '-b:a', '160k']), 'opus'
+        return (['-c:a', 'copy'] if source_codec == 'mp4a' else ['-c:a', 'aac', '-b:a', '192k']), 'm4a'
+
+    def download_audio_variants(self, url, qualities, output_path='.', info=None, progress=None):
+        """Several audio outputs of one video from a single download: the source is fetched once and one
+        FFmpeg run (one decode) writes every missing profile, each stored in result_cache on its own.
+        Returns {quality: (final_path, title) or None}."""
+        profiles = {quality: self.fanout_profile(quality) for quality in qualities}
+        done = {}
+        for profile in dict.fromkeys(profiles.values()):
+            done[profile] = self.get_cached_result(url, profile, output_path)
+        missing = [profile for profile, result in done.items() if not result]
+        ffmpeg = self.ffmpeg_binary()
+        if missing and not ffmpeg:
+            # No FFmpeg to fan out with: convert one profile at a time
+            for profile in missing:
+                done[profile] = self.download_audio(url, profile, output_path, info=info, progress=progress)
+            missing = []
+        if missing:
+            done.update(self._fanout_convert(url, missing, output_path, info, progress, ffmpeg))
+        results, handed_out = {}, set()
+        for quality, profile in profiles.items():
+            result = done[profile] if isinstance(done[profile], tuple) else None
+            if result and profile in handed_out:
+                # Two qualities resolving to one profile each get their own file (the caller deletes after serving)
+                result = (self.share_final_file(result[0]), result[1])
+            handed_out.add(profile)
+            results[quality] = result
+        return results
+
+    def _fanout_convert(self, url, profiles, output_path, info, progress, ffmpeg):
+        if progress and not info:
+            progress({'phase': 'extract', 'status': 'started'})
+        video_info = info or self.get_cached_video_info(url)[0]
+        if not video_info:
+            return {}
+        original_title = video_info.get('title', 'video')
+        expected_title = self.sanitize_filename(original_title)
+        if output_path != '.' and 'downloads' in str(output_path):
+            temp_dir = os.path.join(os.path.normpath(os.path.abspath(output_path)), 'temp')
+            os.makedirs(temp_dir, exist_ok=True)
+        else:
+            temp_dir = self.downloads_dir['temp']
+        job_dir = self.make_job_dir(temp_dir)
+        ticket = self.stages.ticket()  # network slot now, FFmpeg slot once post-processing starts
+        ydl_opts = {
+            **self._get_base_ydl_opts(),
+            **self._progress_opts(progress, ticket),
+            'format': 'bestaudio/best',
+            'outtmpl': os.path.join(job_dir, 'source.%(ext)s'),
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'socket_timeout': 10,
+            'fragment_retries': 3,
+            'retries': 3,
+            'http_chunk_size': 10485760,  # 10MB chunks
+            'concurrent_fragments': 4,
+        }
+        results = {}
+        try:
+            ticket.enter('download')
+            with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                result_info = self._download_with_info(ydl, video_info)
+            source = self.downloaded_filepath(result_info)
+            if not source:
+                sys.stderr.write(f"Error: Could not find downloaded audio source in {job_dir}\n")
+                return {}
+            source_codec = codec_family(result_info.get('acodec'))
+            # Two MP3 bitrates would share one name in final/, so MP3 names carry the bitrate when needed
+            several_mp3 = sum(profile.startswith('mp3-') for profile in profiles) > 1
+            cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-i', source]
+            # Profiles that produce the same output (e.g. 'audio' and 'opus' from an Opus source) share
+            # one FFmpeg output: (args, ext) -> (path, [profiles])
+            outputs = {}
+            for profile in profiles:
+                args, ext = self._fanout_output(profile, source_codec)
+                key = (tuple(args), ext)
+                if key in outputs:
+                    outputs[key][1].append(profile)
+                    continue
+                suffix = f" ({profile[len('mp3-'):]}kbps)" if several_mp3 and ext == 'mp3' else ''
+                path = os.path.join(job_dir, f"{expected_title}{suffix}.{ext}")
+                outputs[key] = (path, [profile])
+                cmd += ['-map', '0:a:0', '-vn'] + args + [path]
+            ticket.enter('postprocess')
+            if progress:
+                progress({'phase': 'transcode', 'status': 'started'})
+            completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if completed.returncode != 0:
+                sys.stderr.write(f"Fan-out FFmpeg failed: {completed.stderr.decode('utf-8', 'replace')[-2000:]}\n")
+                return {}
+            if progress:
+                progress({'phase': 'move', 'status': 'started'})
+            for path, output_profiles in outputs.values():
+                final_path, _ = self.move_to_final_folder(path, os.path.basename(path), output_path)
+                if not final_path:
+                    continue
+                for i, profile in enumerate(output_profiles):
+                    self.store_result(video_info, profile, final_path, original_title)
+                    # Every profile gets its own file: the caller deletes each one after serving it
+                    results[profile] = (final_path if i == 0 else self.share_final_file(final_path), original_title)
+            return results
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            return results
+        finally:
+            ticket.leave()
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def download_mp4_with_sound(self, url, resolution, output_path='.', info=None, progress=None):
+        """MP4 download — temporary simplified: always 1080p, avc1+mp4a preferred (FormatIndex.select_mp4). Pass `info` to reuse
+        an existing extraction, `progress` to receive phase/byte progress events."""
         resolution = 1080
         print(f"Using resolution: {resolution}p (fixed)")
+        profile = f"mp4-{resolution}"
+        cached = self.get_cached_result(url, profile, output_path)
+        if cached:
+            return cached
         # Ստանալ վիդեոյի տեղեկություն (բնօրիգինալ անունը)
-        video_info = self.get_video_info(url)
+        if progress and not info:
+            progress({'phase': 'extract', 'status': 'started'})
+        video_info = info or self.get_cached_video_info(url)[0]
         if not video_info:
             return None
         
@@ -346,9 +824,12 @@ class YouTubeDownloader:
         else:
             temp_dir = self.downloads_dir['temp']
         
+        job_dir = self.make_job_dir(temp_dir)
+        ticket = self.stages.ticket()  # network slot now, FFmpeg slot once post-processing starts
         ydl_opts = {
             **self._get_base_ydl_opts(),
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
+            **self._progress_opts(progress, ticket),
+            'outtmpl': os.path.join(job_dir, '%(title)s.%(ext)s'),
             'quiet': True,
             'no_warnings': True,
             'noplaylist': True,
@@ -364,149 +845,73 @@ class YouTubeDownloader:
             'concurrent_fragments': 4,  # Download fragments in parallel
         }
         
-        # Եթե FFmpeg կա, միավորել video + audio streams (4K inclusive)
-        if self.ffmpeg_dir:
-            # Միայն height<= — լավագույն տեսանյութ մինչև ընտրված ռեզոլյուցիա
+        index = format_index(video_info)
+        # Եթե FFmpeg կա (bundled or on PATH), միավորել video + audio streams (4K inclusive)
+        if self.ffmpeg_binary():
+            # Միայն height<= — the codec-aware pick from the format index goes first (avc1+mp4a copies
+            # straight into MP4); the filter chain repeats the same preference for formats that expired since
+            picked, reason = index.select_mp4(resolution)
             format_str = (
+                f'{picked + "/" if picked else ""}'
+                f'bestvideo[height<={resolution}][vcodec^=avc1]+bestaudio[acodec^=mp4a]/'
+                f'bestvideo[height<={resolution}]+bestaudio[acodec^=mp4a]/'
                 f'bestvideo[height<={resolution}]+bestaudio/'
                 f'best[height<={resolution}]'
             )
+            sys.stderr.write(f"MP4 format {picked or 'by filter'}: {reason}\n")
+            if progress:
+                progress({'phase': 'select', 'status': 'finished', 'format': picked, 'reason': reason})
             ydl_opts.update({
-                'ffmpeg_location': self.ffmpeg_dir,
                 'format': format_str,
                 'merge_output_format': 'mp4',
             })
+            if self.ffmpeg_dir:
+                ydl_opts['ffmpeg_location'] = self.ffmpeg_dir
         else:
             # Without FFmpeg, try to find already merged format
-            # Simplified format selection for speed
+            progressive = index.best_progressive(resolution, ext='mp4')
             format_str = (
-                f'best[height={resolution}][ext=mp4]/'  # Exact resolution
+                f'{progressive.format_id + "/" if progressive else ""}'
                 f'best[height<={resolution}][ext=mp4]/'  # Any up to resolution
                 f'best[ext=mp4]'  # Fallback
             )
             ydl_opts['format'] = format_str
             ydl_opts.pop('postprocessors', None)
             ydl_opts.pop('merge_output_format', None)
-        
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-                file_path = self.find_downloaded_file(url, temp_dir, '.mp4')
+            ticket.enter('download')
+            with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                file_path = self.downloaded_filepath(self._download_with_info(ydl, video_info))
                 if file_path:
+                    if progress:
+                        progress({'phase': 'move', 'status': 'started'})
                     actual_filename = os.path.basename(file_path)
                     final_path, _ = self.move_to_final_folder(file_path, actual_filename, output_path)
                     if final_path:
+                        self.store_result(video_info, profile, final_path, original_title)
                         return final_path, original_title
                     else:
                         sys.stderr.write(f"Error: Failed to move MP4 file to final folder\n")
                         return None
                 else:
-                    sys.stderr.write(f"Error: Could not find downloaded MP4 file in {temp_dir}\n")
+                    sys.stderr.write(f"Error: Could not find downloaded MP4 file in {job_dir}\n")
                     return None
         except Exception as e:
             import traceback
             traceback.print_exc(file=sys.stderr)
-            return self.download_simple_mp4(url, resolution, output_path)
+            ticket.leave()  # download_simple_mp4 takes its own slot
+            return self.download_simple_mp4(url, resolution, output_path, info=video_info, progress=progress)
+        finally:
+            ticket.leave()
+            shutil.rmtree(job_dir, ignore_errors=True)
 
-    def download_simple_mp4(self, url, resolution, output_path):
+    def download_simple_mp4(self, url, resolution, output_path, info=None, progress=None):
         """Պարզ MP4 բեռնում"""
         
         # Ստանալ վիդեոյի տեղեկություն (բնօրիգինալ անունը)
-        video_info = self.get_video_info(url)
+        video_info = info or self.get_cached_video_info(url)[0]
         if not video_info:
             return None
-
-    def download_poster(self, url, poster_quality='high', output_path='.'):
-        """Բեռնում է վիդեոյի thumbnail/poster-ը (low/medium/high)"""
-        info = self.get_video_info(url)
-        if not info:
-            return None, None
-
-        title = info.get('title', 'poster')
-        video_id = info.get('id')
-        if not video_id:
-            return None, None
-
-        # Ensure downloads folder structure exists for Node output_path
-        if output_path != '.' and 'downloads' in output_path:
-            temp_dir = os.path.join(output_path, 'temp')
-            os.makedirs(temp_dir, exist_ok=True)
-            self.downloads_dir['final'] = os.path.join(output_path, 'final')
-            os.makedirs(self.downloads_dir['final'], exist_ok=True)
-        else:
-            temp_dir = self.downloads_dir['temp']
-
-        safe_title = self.sanitize_filename(title)
-        original_filename = f"{safe_title}-poster.jpg"
-
-        # YouTube thumbnail variants (all available sizes)
-        # maxresdefault.jpg is the highest quality (1280x720 or higher)
-        # sddefault.jpg is standard definition (640x480)
-        # hqdefault.jpg is high quality (480x360)
-        # mqdefault.jpg is medium quality (320x180)
-        # default.jpg is low quality (120x90)
-        base = f"https://i.ytimg.com/vi/{video_id}"
-        # Temporary simplified: always maxresdefault (1280x720)
-        quality = 'maxresdefault'
-        
-        # Build candidates list based on quality (fixed to maxresdefault)
-        if quality == 'default':
-            candidates = [f"{base}/default.jpg"]  # 120x90
-        elif quality == 'mqdefault':
-            candidates = [f"{base}/mqdefault.jpg"]  # 320x180
-        elif quality == 'hqdefault':
-            candidates = [f"{base}/hqdefault.jpg"]  # 480x360
-        elif quality == 'sddefault':
-            candidates = [f"{base}/sddefault.jpg"]  # 640x480
-        elif quality == 'maxresdefault':
-            # For maxresdefault, try yt-dlp thumbnail first (if available), then maxresdefault
-            candidates = []
-            thumbnail_url = info.get('thumbnail')
-            if thumbnail_url:
-                candidates.append(thumbnail_url)
-            candidates.append(f"{base}/maxresdefault.jpg")  # 1280x720 or higher
-        else:
-            # Fallback: try maxresdefault first, then others
-            candidates = []
-            thumbnail_url = info.get('thumbnail')
-            if thumbnail_url:
-                candidates.append(thumbnail_url)
-            candidates.extend([
-                f"{base}/maxresdefault.jpg",  # 1280x720 or higher
-                f"{base}/sddefault.jpg",       # 640x480
-                f"{base}/hqdefault.jpg",       # 480x360
-            ])
-
-        out_path = os.path.join(temp_dir, f"{uuid.uuid4().hex}.jpg")
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
-        }
-
-        downloaded = False
-        last_error = None
-        for thumb_url in candidates:
-            try:
-                req = urllib.request.Request(thumb_url, headers=headers)
-                with urllib.request.urlopen(req, timeout=20) as resp:
-                    if resp.status != 200:
-                        continue
-                    data = resp.read()
-                    # Skip tiny "not found" placeholders (less than 1KB)
-                    if not data or len(data) < 1024:
-                        continue
-                    with open(out_path, 'wb') as f:
-                        f.write(data)
-                downloaded = True
-                break
-            except Exception as e:
-                last_error = e
-                continue
-
-        if not downloaded or not os.path.exists(out_path):
-            return None, original_filename
-
-        final_path, _ = self.move_to_final_folder(out_path, original_filename, output_path)
-        return final_path, original_filename
         
         original_title = video_info.get('title', 'video')
         
@@ -521,18 +926,21 @@ class YouTubeDownloader:
             # Local օգտագործման դեպքում
             temp_dir = self.downloads_dir['temp']
         
+        job_dir = self.make_job_dir(temp_dir)
+        ticket = self.stages.ticket()  # network slot now, FFmpeg slot once post-processing starts
         ydl_opts = {
             **self._get_base_ydl_opts(),
+            **self._progress_opts(progress, ticket),
             'format': 'best[ext=mp4]/best',
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
+            'outtmpl': os.path.join(job_dir, '%(title)s.%(ext)s'),
             'quiet': True,
             'no_warnings': True,
         }
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-                file_path = self.find_downloaded_file(url, temp_dir, '.mp4')
+            ticket.enter('download')
+            with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                file_path = self.downloaded_filepath(self._download_with_info(ydl, video_info))
                 if file_path:
                     actual_filename = os.path.basename(file_path)
                     final_path, _ = self.move_to_final_folder(file_path, actual_filename, output_path)
@@ -542,12 +950,326 @@ class YouTubeDownloader:
                         sys.stderr.write(f"Error: Failed to move simple MP4 to final folder\n")
                         return None
                 else:
-                    sys.stderr.write(f"Error: Could not find simple MP4 file in {temp_dir}\n")
+                    sys.stderr.write(f"Error: Could not find simple MP4 file in {job_dir}\n")
                     return None
         except Exception as e:
             import traceback
             traceback.print_exc(file=sys.stderr)
             return None
+        finally:
+            ticket.leave()
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    # Thumbnail variants, best first: maxresdefault (1280x720, not always present), sddefault (640x480),
+    # hqdefault (480x360), mqdefault (320x180), default (120x90)
+    POSTER_VARIANTS = ('maxresdefault', 'sddefault', 'hqdefault', 'mqdefault', 'default')
+    POSTER_MIN_BYTES = 1024  # smaller bodies are "not found" placeholders
+    POSTER_ORIGINAL = 'poster-orig.jpg'  # poster_cache profile of the fetched thumbnail
+    POSTER_WIDTHS = (120, 320, 480, 640, 1280)  # requested widths snap up to these, bounding the variant count
+    POSTER_FORMATS = {  # name -> (Pillow format, content type, extension)
+        'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+        'webp': ('WEBP', 'image/webp', 'webp'),
+        'avif': ('AVIF', 'image/avif', 'avif'),
+    }
+    POSTER_QUALITY = {'jpeg': 85, 'webp': 80, 'avif': 60}
+
+    def http(self):
+        """Shared keep-alive HTTP pool for thumbnail and oEmbed requests (urllib3 comes with yt-dlp[default])"""
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    import urllib3
+                    self._http = urllib3.PoolManager(
+                        num_pools=4,
+                        maxsize=16,
+                        retries=False,
+                        timeout=urllib3.Timeout(connect=3, read=10),
+                        headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"},
+                    )
+                    self._http_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='http')
+        return self._http
+
+    def oembed(self, url):
+        """YouTube's oEmbed metadata (title, author_name, thumbnail_url, ...) — one small request, no
+        extraction. None for private, removed or embed-disabled videos."""
+        try:
+            resp = self.http().request('GET', 'https://www.youtube.com/oembed',
+                                       fields={'url': url, 'format': 'json'}, timeout=5)
+            if resp.status == 200:
+                return json.loads(resp.data)
+        except Exception as e:
+            sys.stderr.write(f"oEmbed failed for {url}: {e}\n")
+        return None
+
+    def oembed_title(self, url):
+        """Video title from oEmbed, or None"""
+        return (self.oembed(url) or {}).get('title')
+
+    def _discard(self, resp):
+        """Reads and drops an unused response so its connection goes back to the pool"""
+        try:
+            resp.drain_conn()
+            resp.release_conn()
+        except Exception:
+            pass
+
+    def fetch_first_image(self, candidates, out_path):
+        """Requests every candidate URL at once and streams the first valid one, in list order, to out_path.
+        Returns the URL used, or None."""
+        http = self.http()
+        futures = [self._http_executor.submit(http.request, 'GET', u, preload_content=False) for u in candidates]
+        chosen = None
+        for candidate, future in zip(candidates, futures):
+            try:
+                resp = future.result()
+            except Exception as e:
+                sys.stderr.write(f"Thumbnail request failed for {candidate}: {e}\n")
+                continue
+            length = resp.headers.get('Content-Length')
+            if chosen or resp.status != 200 or (length and int(length) < self.POSTER_MIN_BYTES):
+                # Lower-priority responses are drained in the background, keeping their connections alive
+                self._http_executor.submit(self._discard, resp)
+                continue
+            try:
+                with open(out_path, 'wb') as f:
+                    for chunk in resp.stream(64 * 1024):
+                        f.write(chunk)
+                resp.release_conn()
+            except Exception as e:
+                sys.stderr.write(f"Thumbnail download failed for {candidate}: {e}\n")
+                resp.release_conn()
+                continue
+            if os.path.getsize(out_path) >= self.POSTER_MIN_BYTES:
+                chosen = candidate
+        return chosen
+
+    def fetch_poster(self, url, poster_quality, temp_dir, info=None, progress=None):
+        """Downloads the best available thumbnail into temp_dir. Returns (temp_path or None, title, video_id).
+        Fast path: video ID from the URL, thumbnail variants requested concurrently, title from the
+        metadata cache or oEmbed — no yt-dlp extraction."""
+        video_id = (info or {}).get('id') or self.video_id_from_url(url)
+        title = (info or {}).get('title')
+        title_future = None
+        if video_id:
+            start = self.POSTER_VARIANTS.index(poster_quality) if poster_quality in self.POSTER_VARIANTS else 0
+            candidates = [f"https://i.ytimg.com/vi/{video_id}/{v}.jpg" for v in self.POSTER_VARIANTS[start:start + 3]]
+            if not title:
+                found, cached = self.info_cache.get(self.video_cache_key(url))
+                if found and cached:
+                    title = cached.get('title')
+                else:
+                    self.http()
+                    title_future = self._http_executor.submit(self.oembed_title, self.clean_url(url))
+        else:
+            # Not a recognizable YouTube URL — fall back to a full extraction
+            if progress:
+                progress({'phase': 'extract', 'status': 'started'})
+            info = self.get_cached_video_info(url)[0]
+            if not info or not info.get('thumbnail'):
+                return None, None, None
+            video_id = info.get('id')
+            title = info.get('title')
+            candidates = [info['thumbnail']]
+
+        os.makedirs(temp_dir, exist_ok=True)
+        out_path = os.path.join(temp_dir, f"{uuid.uuid4().hex}.jpg")
+        if progress:
+            progress({'phase': 'download', 'status': 'started'})
+        chosen = self.fetch_first_image(candidates, out_path)
+        if title_future is not None:
+            title = title_future.result()
+        title = title or video_id or 'poster'
+        if not chosen:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            return None, title, video_id
+        return out_path, title, video_id
+
+    def _poster_meta(self, path, title, fmt):
+        """poster_cache metadata; the ETag is a content hash so it stays stable across LRU touches"""
+        import hashlib
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        _, content_type, ext = self.POSTER_FORMATS[fmt]
+        return {
+            'title': title,
+            'filename': f"{self.sanitize_filename(title)}-poster.{ext}",
+            'content_type': content_type,
+            'etag': f'"{digest}"',
+            'last_modified': time.time(),
+        }
+
+    def download_poster(self, url, poster_quality='high', output_path='.', info=None, progress=None):
+        """Բեռնում է վիդեոյի thumbnail/poster-ը (low/medium/high)"""
+        # Temporary simplified: always maxresdefault (1280x720), falling back to smaller variants.
+        # Only that default poster is cached (as the original all resized variants are made from)
+        cacheable = poster_quality not in self.POSTER_VARIANTS[1:]
+        if cacheable:
+            cached = self.get_cached_result(url, self.POSTER_ORIGINAL, output_path, cache=self.poster_cache)
+            if cached:
+                return cached[0], f"{self.sanitize_filename(cached[1])}-poster.jpg"
+
+        # Ensure downloads folder structure exists for Node output_path
+        if output_path != '.' and 'downloads' in output_path:
+            temp_dir = os.path.join(output_path, 'temp')
+            self.downloads_dir['final'] = os.path.join(output_path, 'final')
+            os.makedirs(self.downloads_dir['final'], exist_ok=True)
+        else:
+            temp_dir = self.downloads_dir['temp']
+
+        out_path, title, video_id = self.fetch_poster(url, poster_quality, temp_dir, info=info, progress=progress)
+        if title is None:
+            return None, None
+        original_filename = f"{self.sanitize_filename(title)}-poster.jpg"
+        if not out_path:
+            return None, original_filename
+
+        final_path, _ = self.move_to_final_folder(out_path, original_filename, output_path)
+        if cacheable and video_id and final_path:
+            self.poster_cache.put(video_id, self.POSTER_ORIGINAL, final_path,
+                                  self._poster_meta(final_path, title, 'jpeg'))
+        return final_path, original_filename
+
+    def poster_variant(self, url, width=None, fmt='jpeg'):
+        """Poster for url, resized to width (snapped up to POSTER_WIDTHS; None keeps the original size) and
+        encoded as fmt, served from poster_cache and produced from one cached original on a miss.
+        Returns (data_path, meta) or None. Without Pillow only the original JPEG is available."""
+        video_id = self.video_id_from_url(url)
+        if not video_id:
+            return None
+        image_lib = load_pillow()
+        if image_lib is None or fmt not in self.poster_formats():
+            width, fmt = None, 'jpeg'
+        if width:
+            width = next((w for w in self.POSTER_WIDTHS if w >= width), self.POSTER_WIDTHS[-1])
+        if not width and fmt == 'jpeg':
+            profile = self.POSTER_ORIGINAL
+        else:
+            profile = f"poster-{width or 'orig'}.{self.POSTER_FORMATS[fmt][2]}"
+            cached = self.poster_cache.get(video_id, profile)
+            if cached:
+                return cached
+
+        original = self.poster_cache.get(video_id, self.POSTER_ORIGINAL)
+        if not original:
+            out_path, title, _ = self.fetch_poster(url, 'maxresdefault', self.downloads_dir['temp'])
+            if not out_path:
+                return None
+            try:
+                self.poster_cache.put(video_id, self.POSTER_ORIGINAL, out_path, self._poster_meta(out_path, title, 'jpeg'))
+            finally:
+                os.remove(out_path)
+            original = self.poster_cache.get(video_id, self.POSTER_ORIGINAL)
+            if not original:
+                return None
+        if profile == self.POSTER_ORIGINAL:
+            return original
+
+        original_path, original_meta = original
+        pil_format = self.POSTER_FORMATS[fmt][0]
+        out_path = os.path.join(self.downloads_dir['temp'], f"{uuid.uuid4().hex}.{self.POSTER_FORMATS[fmt][2]}")
+        os.makedirs(self.downloads_dir['temp'], exist_ok=True)
+        try:
+            with image_lib.open(original_path) as img:
+                img = img.convert('RGB')
+                if width and width < img.width:
+                    img = img.resize((width, round(img.height * width / img.width)), image_lib.LANCZOS)
+                img.save(out_path, pil_format, quality=self.POSTER_QUALITY[fmt])
+            self.poster_cache.put(video_id, profile, out_path, self._poster_meta(out_path, original_meta['title'], fmt))
+        finally:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+        return self.poster_cache.get(video_id, profile)
+
+    def poster_formats(self):
+        """Output formats the installed Pillow can encode (always includes jpeg)"""
+        image_lib = load_pillow()
+        if image_lib is None:
+            return ['jpeg']
+        return [fmt for fmt, (pil_format, _, _) in self.POSTER_FORMATS.items() if pil_format in image_lib.SAVE]
+
+    def ffmpeg_binary(self):
+        """FFmpeg executable: the bundled one when present, else ffmpeg from PATH"""
+        if self.ffmpeg_dir:
+            return os.path.join(self.ffmpeg_dir, "ffmpeg.exe")
+        return shutil.which('ffmpeg')
+
+    # Streamed passthrough audio: codec family -> (muxer args, fallback encoder args, extension, media type)
+    STREAM_AUDIO = {
+        'mp4a': (['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+                 ['-c:a', 'aac', '-b:a', '192k'], 'm4a', 'audio/mp4'),
+        'opus': (['-f', 'ogg'], ['-c:a', 'libopus', '-b:a', '160k'], 'opus', 'audio/ogg'),
+    }
+
+    def open_stream(self, url, quality='mp3', info=None):
+        """Starts FFmpeg writing the converted media to stdout, for piping straight into an HTTP response.
+        MP3 is transcoded on the fly; m4a/opus/audio and MP4 are stream-copied (fragmented MP4 / Ogg). Returns
+        {'process', 'filename', 'media_type'} or None."""
+        ffmpeg = self.ffmpeg_binary()
+        if not ffmpeg:
+            sys.stderr.write("open_stream: FFmpeg not found\n")
+            return None
+        video_info = info or self.get_cached_video_info(url)[0]
+        if not video_info:
+            return None
+        quality = str(quality)
+        passthrough = quality in self.AUDIO_PROFILES
+        is_mp3 = self.is_audio_quality(quality) and not passthrough
+        if is_mp3:
+            format_str, pool_profile = 'bestaudio/best', 'stream-mp3'
+        elif passthrough:
+            format_str, pool_profile = self.AUDIO_PROFILES[quality][0], f'stream-{quality}'
+        else:
+            # MP4 in a fragmented container needs MP4-compatible streams to copy
+            format_str = ('bestvideo[height<=1080][vcodec^=avc1]+bestaudio[acodec^=mp4a]/'
+                          'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]/best[ext=mp4]')
+            pool_profile = 'stream-mp4'
+        ydl_opts = {
+            **self._get_base_ydl_opts(),
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'format': format_str,
+        }
+        try:
+            with self.ydl_pool.acquire(pool_profile, ydl_opts) as ydl:
+                selected = ydl.process_ie_result(ydl.sanitize_info(video_info, remove_private_keys=True), download=False)
+                formats = selected.get('requested_formats') or [selected]
+                inputs = []
+                for f in formats:
+                    headers = dict(f.get('http_headers') or {})
+                    cookie = ydl.cookiejar.get_cookie_header(f['url'])
+                    if cookie:
+                        headers['Cookie'] = cookie
+                    if headers:
+                        inputs += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+                    inputs += ['-i', f['url']]
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+            return None
+
+        if is_mp3:
+            # Temporary simplified: always 320kbps, like download_mp3
+            output = ['-vn', '-c:a', 'libmp3lame', '-b:a', '320k', '-f', 'mp3', 'pipe:1']
+            ext, media_type = 'mp3', 'audio/mpeg'
+        elif passthrough:
+            source = codec_family(formats[0].get('acodec'))
+            target = {'m4a': 'mp4a', 'opus': 'opus'}.get(quality) or (source if source in self.STREAM_AUDIO else 'mp4a')
+            muxer, encoder, ext, media_type = self.STREAM_AUDIO[target]
+            # Copy when the selected stream already has the target codec; encode only as a fallback
+            output = ['-vn'] + (['-c:a', 'copy'] if source == target else encoder) + muxer + ['pipe:1']
+        else:
+            maps = ['-map', '0:v:0', '-map', '1:a:0'] if len(formats) > 1 else []
+            output = maps + ['-c', 'copy', '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                             '-f', 'mp4', 'pipe:1']
+            ext, media_type = 'mp4', 'video/mp4'
+        cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin'] + inputs + output
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return {
+            'process': process,
+            'filename': f"{video_info.get('title', 'video')}.{ext}",
+            'media_type': media_type,
+        }
 
     def check_and_open_file(self, url, resolution, output_path):
         """Ստուգում է ֆայլի ստեղծումը և փորձում բացել"""
@@ -592,49 +1314,7 @@ class YouTubeDownloader:
         """Ստանում է ստանդարտ ռեզոլյուցիաները, որոնք հասանելի են տեսանյութում (360-ից մինչև 2160)"""
         if not info:
             return []
-            
-        formats = info.get('formats', [])
-        all_heights = set()
-        
-        # Հավաքել բոլոր հասանելի heights-ները formats-ից
-        # YouTube-ում video և audio streams-ները հաճախ առանձին են, բայց կարող են միավորվել
-        for f in formats:
-            height = f.get('height')
-            if height and height > 0:
-                # Ստուգել որ ունի video stream (կարող է լինել առանց audio, բայց կմիավորվի)
-                has_video = f.get('vcodec') != 'none'
-                if has_video:
-                    all_heights.add(height)
-        
-        if not all_heights:
-            return []
-        
-        # Ստանդարտ ռեզոլյուցիաները (360-ից մինչև 2160)
-        relevant_standards = [r for r in self.standard_resolutions if r >= 360 and r <= 2160]
-        
-        # Գտնել բոլոր ստանդարտ ռեզոլյուցիաները, որոնք հասանելի են
-        # Օգտագործել ավելի մեծ tolerance (20px) որպեսզի գտնենք բոլոր հնարավորները
-        standard_available = []
-        for std_res in relevant_standards:
-            # Ստուգել եթե կա format, որի height-ը մոտ է այս ստանդարտին
-            for height in all_heights:
-                if abs(height - std_res) <= 20:  # 20px tolerance
-                    if std_res not in standard_available:
-                        standard_available.append(std_res)
-                    break
-        
-        # Եթե չենք գտել ստանդարտներ, փորձել գտնել ամենամոտ ստանդարտները
-        if not standard_available:
-            for height in sorted(all_heights, reverse=True):
-                if height >= 360 and height <= 2160:
-                    # Գտնել ամենամոտ ստանդարտ ռեզոլյուցիան
-                    closest_std = min(relevant_standards, key=lambda x: abs(x - height))
-                    if abs(closest_std - height) <= 50:  # 50px tolerance
-                        if closest_std not in standard_available:
-                            standard_available.append(closest_std)
-        
-        # Վերադարձնել բոլոր հասանելի ստանդարտ ռեզոլյուցիաները (360-ից մինչև 2160)
-        return sorted(standard_available, reverse=True)
+        return list(format_index(info).resolutions)
 
     def download_mp3_playlist_interactive(self, playlist_url):
         """Ինտերակտիվ MP3 պլեյլիստի բեռնում"""
@@ -762,9 +1442,9 @@ class YouTubeDownloader:
             
             if choice == 1:
                 # Ընտրել ռեզոլյուցիա
-                selected_res = self.select_standard_resolution(resolutions)
+                selected_res = self.select_standard_resolution(resolutions, format_index(video_info).sizes())
                 if selected_res:
-                    result = self.download_mp4_with_sound(video_url, selected_res, playlist_folder)
+                    result = self.download_mp4_with_sound(video_url, selected_res, playlist_folder, info=video_info)
                     if isinstance(result, tuple) and result[0]:
                         success_count += 1
                         print(f"✅ {selected_res}p բեռնված ({success_count}/{len(entries)})")
@@ -788,8 +1468,117 @@ class YouTubeDownloader:
         # Ամփոփում
         self.show_summary(success_count, skip_count, len(entries), playlist_folder)
 
-    def select_standard_resolution(self, resolutions):
-        """Ընտրում է ստանդարտ ռեզոլյուցիան"""
+    # Rough per-entry conversion time used to size the pool before any entry has been measured
+    PLAYLIST_ENTRY_SECONDS = {'mp3': 30, 'mp4': 90}
+
+    def _write_manifest(self, manifest_path, manifest):
+        """Writes the playlist manifest atomically (temp file + os.replace)"""
+        tmp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def download_playlist_batch(self, playlist_url, quality='mp3', output_path='.', max_workers=4,
+                                target_seconds=None, progress=None):
+        """Ոչ ինտերակտիվ պլեյլիստի բեռնում — converts every entry with a bounded parallel pool.
+        Finished entries are recorded in <folder>/manifest.json, so a re-run skips them and resumes.
+        With target_seconds, the pool is sized (up to max_workers) to finish the playlist in about that time."""
+        playlist_info = self.get_playlist_info(playlist_url)
+        if not playlist_info:
+            return {"success": False, "message": "Failed to get playlist info"}
+        entries = [e for e in (playlist_info.get('entries') or []) if e and e.get('id')]
+        if not entries:
+            return {"success": False, "message": "Playlist is empty"}
+
+        kind = 'mp3' if self.is_audio_quality(quality) else 'mp4'
+        playlist_title = playlist_info.get('title', f'Playlist_{kind.upper()}')
+        safe_title = "".join(c for c in playlist_title if c.isalnum() or c in (' ', '_')).rstrip() or 'Playlist'
+        base = os.getcwd() if output_path == '.' else output_path
+        playlist_folder = os.path.join(base, safe_title)
+        os.makedirs(playlist_folder, exist_ok=True)
+
+        manifest_path = os.path.join(playlist_folder, 'manifest.json')
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.update({'playlist_url': playlist_url, 'title': playlist_title, 'quality': quality})
+        done_entries = manifest.setdefault('entries', {})
+
+        def is_done(video_id):
+            entry = done_entries.get(video_id)
+            return bool(entry and entry.get('status') == 'done' and entry.get('file_path')
+                        and os.path.isfile(entry['file_path']))
+
+        pending = [e for e in entries if not is_done(e['id'])]
+        skipped = len(entries) - len(pending)
+
+        # Size the pool from measured durations when earlier runs recorded them
+        durations = [e['seconds'] for e in done_entries.values() if e.get('seconds')]
+        per_entry = sum(durations) / len(durations) if durations else self.PLAYLIST_ENTRY_SECONDS[kind]
+        workers = max_workers
+        if target_seconds:
+            workers = min(max_workers, max(1, math.ceil(len(pending) * per_entry / target_seconds)))
+        print(f"Playlist {playlist_title}: {len(pending)} to convert, {skipped} already done, {workers} worker(s)")
+
+        lock = threading.Lock()
+        counts = {'done': 0, 'failed': 0}
+
+        def convert(entry):
+            video_url = f"https://www.youtube.com/watch?v={entry['id']}"
+            started = time.monotonic()
+            if kind == 'mp3':
+                result = self.download_audio(video_url, quality, playlist_folder)
+            else:
+                result = self.download_mp4_with_sound(video_url, 1080, playlist_folder)
+            ok = isinstance(result, tuple) and result[0]
+            return {
+                'status': 'done' if ok else 'failed',
+                'title': entry.get('title'),
+                'file_path': result[0] if ok else None,
+                'seconds': round(time.monotonic() - started, 1),
+            }
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert, entry): entry for entry in pending}
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    traceback.print_exc(file=sys.stderr)
+                    record = {'status': 'failed', 'title': entry.get('title'), 'error': str(e)}
+                with lock:
+                    done_entries[entry['id']] = record
+                    counts[record['status']] += 1
+                    self._write_manifest(manifest_path, manifest)
+                    completed = skipped + counts['done'] + counts['failed']
+                if progress:
+                    progress({
+                        'phase': 'playlist',
+                        'status': record['status'],
+                        'video_id': entry['id'],
+                        'title': entry.get('title'),
+                        'completed': completed,
+                        'total': len(entries),
+                    })
+
+        self._write_manifest(manifest_path, manifest)
+        return {
+            "success": counts['failed'] == 0,
+            "message": f"{counts['done']} converted, {skipped} skipped, {counts['failed']} failed",
+            "playlist_title": playlist_title,
+            "folder": playlist_folder,
+            "manifest": manifest_path,
+            "total": len(entries),
+            "done": counts['done'],
+            "skipped": skipped,
+            "failed": counts['failed'],
+        }
+
+    def select_standard_resolution(self, resolutions, sizes=None):
+        """Ընտրում է ստանդարտ ռեզոլյուցիան; sizes ({resolution: bytes}, from the format index) are shown when known"""
         print("\n📊 ՍՏԱՆԴԱՐՏ ՌԵԶՈԼՅՈՒՑԻԱՆԵՐԸ:")
         
         # Կցել ստանդարտ անունները
@@ -806,7 +1595,8 @@ class YouTubeDownloader:
         
         for idx, res in enumerate(resolutions, 1):
             name = resolution_names.get(res, f"{res}p")
-            print(f"{idx}. {name}")
+            size = (sizes or {}).get(res)
+            print(f"{idx}. {name}" + (f" ~{size / 1024 ** 2:.0f} MB" if size else ""))
         
         print(f"{len(resolutions) + 1}. ↩️  Վերադառնալ")
         
@@ -930,7 +1720,7 @@ class YouTubeDownloader:
             return
         
         # Ընտրել ռեզոլյուցիա
-        selected_res = self.select_standard_resolution(resolutions)
+        selected_res = self.select_standard_resolution(resolutions, format_index(info).sizes())
         if not selected_res:
             return
         
@@ -938,7 +1728,7 @@ class YouTubeDownloader:
         confirm = input(f"\n✅ Բեռնել {selected_res}p MP4? (y/n): ").strip().lower()
         
         if confirm == 'y':
-            result = self.download_mp4_with_sound(url, selected_res)
+            result = self.download_mp4_with_sound(url, selected_res, info=info)
             if isinstance(result, tuple) and result[0]:
                 safe_path, original_title = result
                 print(f"✅ Բեռնված: {original_title}")
@@ -1068,14 +1858,181 @@ class YouTubeDownloader:
         else:
             return f"{minutes}:{secs:02d}"
 
+def cli_info(downloader, url, mode='full'):
+    """info action: video info dict (mode 'full' or 'preview')"""
+    return json.loads(downloader.get_video_info_json(url, mode))
+
+def cli_download(downloader, url, quality='mp3', output_path='.', progress=None):
+    """download action: converts one video and describes the result"""
+    url = downloader.clean_url(url)
+    file_path = None
+    original_filename = None
+
+    # Audio qualities: mp3, mp3-128 … mp3-320 (transcoded), m4a / opus / audio (stream copy)
+    if downloader.is_audio_quality(quality):
+        result = downloader.download_audio(url, quality, output_path, progress=progress)
+    else:
+        # Convert quality string to resolution number
+        resolution = int(quality.replace('p', '')) if quality.endswith('p') else 720
+        result = downloader.download_mp4_with_sound(url, resolution, output_path, progress=progress)
+    if isinstance(result, tuple):
+        file_path, original_filename = result
+    else:
+        file_path = result
+
+    # Use safe filename for file_path, but preserve original filename
+    output_filename = original_filename if original_filename else (os.path.basename(file_path) if file_path else 'unknown')
+
+    return {
+        "success": file_path is not None,
+        "message": f"Download completed as {quality}" if file_path else f"Failed to download as {quality}",
+        "quality": quality,
+        "format": downloader.audio_profile(quality)[0].split('-')[0] if downloader.is_audio_quality(quality) else "mp4",
+        "file_path": file_path,
+        "original_filename": output_filename
+    }
+
+def cli_variants(downloader, url, qualities='mp3-128,mp3-192,mp3-320', output_path='.', progress=None):
+    """variants action: several audio qualities (comma-separated or a list) from one download and one FFmpeg run"""
+    if isinstance(qualities, str):
+        qualities = [q.strip() for q in qualities.split(',') if q.strip()]
+    invalid = [q for q in qualities if not downloader.is_audio_quality(q)]
+    if not qualities or invalid:
+        return {"success": False, "message": f"Audio qualities required, got {invalid or qualities}"}
+    results = downloader.download_audio_variants(downloader.clean_url(url), qualities, output_path, progress=progress)
+    return {
+        "success": all(results.values()),
+        "results": {
+            quality: {
+                "success": result is not None,
+                "file_path": result[0] if result else None,
+                "original_filename": os.path.basename(result[0]) if result else None,
+            }
+            for quality, result in results.items()
+        },
+    }
+
+def cli_poster(downloader, url, poster_quality='high', output_path='.', progress=None):
+    """poster action: downloads the thumbnail and describes the result"""
+    url = downloader.clean_url(url)
+    file_path, original_filename = downloader.download_poster(url, poster_quality, output_path, progress=progress)
+    return {
+        "success": file_path is not None,
+        "message": "Poster prepared" if file_path else "Failed to prepare poster",
+        "format": "poster",
+        "file_path": file_path,
+        "original_filename": original_filename or (os.path.basename(file_path) if file_path else "poster.jpg")
+    }
+
+def cli_playlist(downloader, url, quality='mp3', output_path='.', max_workers=4, target_seconds=None, progress=None):
+    """playlist action: batch-converts a whole playlist"""
+    return downloader.download_playlist_batch(
+        url, quality, output_path, max_workers=int(max_workers),
+        target_seconds=float(target_seconds) if target_seconds else None, progress=progress,
+    )
+
+CLI_ACTIONS = {
+    'info': cli_info,
+    'download': cli_download,
+    'variants': cli_variants,
+    'poster': cli_poster,
+    'playlist': cli_playlist,
+}
+
+def _serve_connection(downloader, rfile, wfile, pool):
+    """Reads JSON requests line by line from rfile and runs them concurrently on pool.
+    Request:  {"id": ..., "action": "info"|"download"|"variants"|"poster"|"playlist", "progress": bool, ...action args}
+    Replies:  {"id": ..., "result": {...}} or {"id": ..., "error": "..."}, preceded by
+              {"id": ..., "event": {...}} progress lines when "progress" is true."""
+    write_lock = threading.Lock()
+
+    def send(message):
+        line = json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n"
+        with write_lock:
+            try:
+                wfile.write(line)
+                wfile.flush()
+            except (OSError, ValueError):
+                pass  # caller went away
+
+    def handle(request):
+        request_id = request.get('id')
+        action = CLI_ACTIONS.get(request.get('action'))
+        if action is None:
+            send({"id": request_id, "error": f"Unknown action: {request.get('action')}"})
+            return
+        kwargs = {k: v for k, v in request.items() if k not in ('id', 'action', 'progress')}
+        if request.get('progress') and action is not cli_info:
+            kwargs['progress'] = lambda event: send({"id": request_id, "event": event})
+        try:
+            send({"id": request_id, "result": action(downloader, **kwargs)})
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            send({"id": request_id, "error": f"{type(e).__name__}: {e}"})
+
+    pending = set()
+    for raw in rfile:
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            request = json.loads(raw)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            send({"id": None, "error": f"Invalid request: {e}"})
+            continue
+        if request.get('action') == 'ping':
+            send({"id": request.get('id'), "result": {"success": True}})
+            continue
+        pending.add(pool.submit(handle, request))
+        pending = {f for f in pending if not f.done()}
+    # EOF: let in-flight requests answer before the stream is closed
+    for future in pending:
+        future.result()
+
+def serve(downloader, socket_path=None, workers=4):
+    """Persistent worker: one warm interpreter and downloader answering many requests
+    over stdin/stdout, or over a Unix socket when socket_path is given"""
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='serve')
+    protocol_out = sys.stdout.buffer
+    # Downloader methods print progress text; keep it off the protocol stream
+    sys.stdout = sys.stderr
+    threading.Thread(target=downloader.preload, name='preload', daemon=True).start()
+    try:
+        if socket_path is None:
+            sys.stderr.write(f"[serve] ready on stdin/stdout ({workers} workers)\n")
+            _serve_connection(downloader, sys.stdin.buffer, protocol_out, pool)
+            return
+
+        import socketserver
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                _serve_connection(downloader, self.rfile, self.wfile, pool)
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        with Server(socket_path, Handler) as server:
+            sys.stderr.write(f"[serve] listening on {socket_path} ({workers} workers)\n")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.remove(socket_path)
+    finally:
+        pool.shutdown(wait=True)
+
 def main():
     """Գլխավոր ֆունկցիա"""
-    # Ստուգել yt-dlp-ը
-    try:
-        import yt_dlp
-    except ImportError:
+    # Ստուգել yt-dlp-ը (առանց ներմուծելու — it is imported on first use)
+    import importlib.util
+    if importlib.util.find_spec('yt_dlp') is None:
         os.system(f"{sys.executable} -m pip install yt-dlp")
-        import yt_dlp
     
     # Ստեղծել բեռնիչը
     downloader = YouTubeDownloader()
@@ -1083,85 +2040,28 @@ def main():
     # CLI mode for API calls
     if len(sys.argv) > 1:
         action = sys.argv[1]
-        
-        if action == 'info':
-            # Get video info in JSON format
-            url = sys.argv[2] if len(sys.argv) > 2 else None
-            if url:
-                result = downloader.get_video_info_json(url)
-                # Ensure output is UTF-8
-                if isinstance(result, str):
-                    sys.stdout.write(result)
-                else:
-                    sys.stdout.write(json.dumps(result, ensure_ascii=False))
-            else:
-                sys.stdout.write(json.dumps({"success": False, "error": "URL required"}))
-        
-        elif action == 'download':
-            # Download video
+
+        if action == 'serve':
+            # python yt.py serve [--socket PATH] [--workers N]
+            args = sys.argv[2:]
+            socket_path = args[args.index('--socket') + 1] if '--socket' in args else None
+            workers = int(args[args.index('--workers') + 1]) if '--workers' in args else 4
+            serve(downloader, socket_path, workers)
+        elif action in CLI_ACTIONS:
             url = sys.argv[2] if len(sys.argv) > 2 else None
-            quality = sys.argv[3] if len(sys.argv) > 3 else 'mp3'
-            output_path = sys.argv[4] if len(sys.argv) > 4 else '.'
-            
             if not url:
                 sys.stdout.write(json.dumps({"success": False, "error": "URL required"}))
                 return
-            
-            url = downloader.clean_url(url)
-            file_path = None
-            original_filename = None
-            
-            # Check if it's MP3 quality (mp3, mp3-128, mp3-160, mp3-192, mp3-320)
-            if quality == 'mp3' or quality.startswith('mp3-'):
-                # Extract kbps from quality string (e.g., 'mp3-192' -> '192')
-                if quality.startswith('mp3-'):
-                    kbps = quality.replace('mp3-', '')
-                else:
-                    kbps = '320'  # Default to 320 kbps for 'mp3'
-                result = downloader.download_mp3(url, output_path, kbps)
-                if isinstance(result, tuple):
-                    file_path, original_filename = result
-                else:
-                    file_path = result
+            # Positional arguments after the URL, e.g. download <url> [quality] [output_path]
+            args = sys.argv[3:]
+            if action == 'playlist':
+                # Progress lines go to stderr, the JSON result to stdout
+                result = cli_playlist(
+                    downloader, url, *args,
+                    progress=lambda event: sys.stderr.write(json.dumps(event, ensure_ascii=False) + "\n"),
+                )
             else:
-                # Convert quality string to resolution number
-                resolution = int(quality.replace('p', '')) if quality.endswith('p') else 720
-                result = downloader.download_mp4_with_sound(url, resolution, output_path)
-                if isinstance(result, tuple):
-                    file_path, original_filename = result
-                else:
-                    file_path = result
-            
-            # Use safe filename for file_path, but preserve original filename
-            output_filename = original_filename if original_filename else (os.path.basename(file_path) if file_path else 'unknown')
-            
-            result = {
-                "success": file_path is not None,
-                "message": f"Download completed as {quality}" if file_path else f"Failed to download as {quality}",
-                "quality": quality,
-                "format": "mp3" if (quality == "mp3" or quality.startswith("mp3-")) else "mp4",
-                "file_path": file_path,
-                "original_filename": output_filename
-            }
-            sys.stdout.write(json.dumps(result, ensure_ascii=False))
-        elif action == 'poster':
-            url = sys.argv[2] if len(sys.argv) > 2 else None
-            poster_quality = sys.argv[3] if len(sys.argv) > 3 else 'high'
-            output_path = sys.argv[4] if len(sys.argv) > 4 else '.'
-
-            if not url:
-                sys.stdout.write(json.dumps({"success": False, "error": "URL required"}))
-                return
-
-            url = downloader.clean_url(url)
-            file_path, original_filename = downloader.download_poster(url, poster_quality, output_path)
-            result = {
-                "success": file_path is not None,
-                "message": "Poster prepared" if file_path else "Failed to prepare poster",
-                "format": "poster",
-                "file_path": file_path,
-                "original_filename": original_filename or (os.path.basename(file_path) if file_path else "poster.jpg")
-            }
+                result = CLI_ACTIONS[action](downloader, url, *args)
             sys.stdout.write(json.dumps(result, ensure_ascii=False))
         else:
             downloader.main_menu()
@@ -1170,4 +2070,4 @@ def main():
         downloader.main_menu()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()